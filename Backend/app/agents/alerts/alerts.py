@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from datetime import datetime, timedelta
 from app.database.mongo import messages_collection, alerts_collection
 from app.agents.alerts.models import AlertResponse
 from typing import List, Optional
 from bson import ObjectId
 from app.agents.alerts.models import AlertUpdate
+from app.core.pagination import NEXT_CURSOR_HEADER, keyset_query, keyset_sort, next_cursor
 
 from fastapi import status
 
@@ -91,9 +92,11 @@ async def generate_alerts():
 
 @router.get("/alerts", response_model=List[AlertResponse])
 async def list_alerts(
+    response: Response,
     status: Optional[str] = "pending",
     limit: int = 50,
-    skip: int = 0
+    skip: int = 0,
+    cursor: Optional[str] = None
 ):
     """
     Lista todas las alertas con filtro por estado.
@@ -102,15 +105,19 @@ async def list_alerts(
     - status: Estado de la alerta (pending, in_progress, resolved)
     - limit: Límite de resultados
     - skip: Saltar resultados (paginación)
+    - cursor: Cursor de la página siguiente (header X-Next-Cursor); ignora skip
     """
     try:
-        query = {"status": status} if status else {}
+        query = keyset_query({"status": status} if status else {}, "timestamp", cursor)
         
-        alerts = await alerts_collection.find(query)\
-            .sort("timestamp", -1)\
-            .skip(skip)\
-            .limit(limit)\
-            .to_list(length=None)
+        alerts_cursor = alerts_collection.find(query).sort(keyset_sort("timestamp"))
+        if not cursor:
+            alerts_cursor = alerts_cursor.skip(skip)
+        alerts = await alerts_cursor.limit(limit).to_list(length=limit)
+
+        token = next_cursor(alerts, "timestamp", limit)
+        if token:
+            response.headers[NEXT_CURSOR_HEADER] = token
         
         # Convertir ObjectId a string y ajustar formato
         processed_alerts = []
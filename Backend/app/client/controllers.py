@@ -2,6 +2,7 @@ from fastapi import HTTPException
 from bson import json_util
 import json
 from app.database.mongo import contacts_collection
+from app.search.controllers import SEARCH_FIELDS_EXCLUDED
 from typing import List
 
 async def get_all_contacts() -> List[dict]:
@@ -10,7 +11,7 @@ async def get_all_contacts() -> List[dict]:
     """
     try:
         # Obtener todos los documentos sin filtros (usando to_list() para Motor)
-        contacts = await contacts_collection.find({}).to_list(length=None)
+        contacts = await contacts_collection.find({}, SEARCH_FIELDS_EXCLUDED).to_list(length=None)
         
         # Convertir ObjectId y otros campos BSON a JSON serializable
         contacts_json = json.loads(json_util.dumps(contacts))
@@ -3,6 +3,15 @@ from datetime import datetime, timedelta
 from typing import Optional
 from app.database.mongo import message_collection, contacts_collection
 from app.manychat.controllers import get_subscriber_info
+from app.core.pagination import keyset_query, keyset_sort, next_cursor
+from app.core.serialization import MongoJSONResponse
+from app.search.controllers import (
+    CONTACT_REGEX_FIELDS,
+    SEARCH_FIELDS_EXCLUDED,
+    contact_search_fields,
+    regex_filter,
+    text_filter,
+)
 
 router = APIRouter()
 
@@ -78,6 +87,7 @@ async def create_contact_from_message(message, subscriber_data):
         **({"nombre_cuenta": canal_data["nombre_cuenta"]} if canal_data["nombre_cuenta"] else {}),
         "info": subscriber_data,
     }
+    contacto.update(contact_search_fields(contacto))
 
     return contacto
 
@@ -113,18 +123,23 @@ def determine_channel(identifiers, subscriber_data, message):
 
 @router.get("/contacts/info")
 async def get_all_contacts_info(
-    skip: int = Query(0, ge=0, description="Número de documentos a saltar"),
+    skip: int = Query(0, ge=0, description="Número de documentos a saltar (orden: _id descendente)"),
     limit: int = Query(10, le=100, description="Número máximo de documentos a devolver"),
     canal: Optional[str] = Query(None, description="Filtrar por canal (whatsapp, instagram, etc)"),
     search: Optional[str] = Query(None, description="Texto para buscar en nombres, números o cuentas"),
     last_hours: Optional[int] = Query(None, description="Filtrar contactos actualizados en las últimas X horas"),
-    with_new: bool = Query(True, description="Incluir procesamiento de nuevos contactos")
+    with_new: bool = Query(True, description="Incluir procesamiento de nuevos contactos"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (pagination.next_cursor); ignora skip")
 ):
     """
     Obtiene información de todos los contactos con opciones de filtrado y paginación.
     
     Procesa nuevos contactos de mensajes no registrados y devuelve los contactos existentes
     con posibilidad de filtrar por canal, texto de búsqueda y tiempo de actualización.
+
+    Orden: siempre por `_id` descendente (los contactos más nuevos primero), también
+    con skip/limit. Antes las páginas sin cursor salían en el orden natural de
+    Mongo, que no es estable; quien pagine con skip debe empezar de nuevo desde 0.
     """
     try:
         # Procesar nuevos contactos si se solicita
@@ -139,27 +154,32 @@ async def get_all_contacts_info(
         if canal:
             query["canal"] = canal.lower()
             
-        if search:
-            query["$or"] = [
-                {"info.first_name": {"$regex": search, "$options": "i"}},
-                {"info.last_name": {"$regex": search, "$options": "i"}},
-                {"numero": {"$regex": search, "$options": "i"}},
-                {"nombre_cuenta": {"$regex": search, "$options": "i"}},
-                {"info.whatsapp_phone": {"$regex": search, "$options": "i"}}
-            ]
-            
         if last_hours:
             cutoff_time = datetime.utcnow() - timedelta(hours=last_hours)
             query["last_updated"] = {"$gte": cutoff_time}
+
+        filters = dict(query)
+        if search:
+            # Prefijos normalizados e indexados; consultas cortas van por $regex
+            search_filter, _ = text_filter(search, CONTACT_REGEX_FIELDS)
+            query = {**filters, **search_filter}
         
         # Obtener total de contactos que coinciden con los filtros
         total = await contacts_collection.count_documents(query)
+        if search and not total and "search_prefixes" in query:
+            # Sin coincidencias por prefijo: subcadena en medio de palabra, como antes
+            query = {**filters, **regex_filter(search, CONTACT_REGEX_FIELDS)}
+            total = await contacts_collection.count_documents(query)
         
-        # Obtener contactos paginados
+        # Obtener contactos paginados (por _id descendente: estable y sin costo por profundidad)
         contactos = []
-        cursor = contacts_collection.find(query).skip(skip).limit(limit)
+        contacts_cursor = contacts_collection.find(keyset_query(query, "_id", cursor), SEARCH_FIELDS_EXCLUDED).sort(keyset_sort("_id"))
+        if not cursor:
+            contacts_cursor = contacts_cursor.skip(skip)
+        page = await contacts_cursor.limit(limit).to_list(length=limit)
+        token = next_cursor(page, "_id", limit)
         
-        async for contacto in cursor:
+        for contacto in page:
             contacto["_id"] = str(contacto["_id"])
             
             # Formatear fechas para mejor legibilidad
@@ -178,21 +198,24 @@ async def get_all_contacts_info(
         async for stat in contacts_collection.aggregate(pipeline):
             stats_by_channel[stat["_id"]] = stat["count"]
         
-        return {
+        return MongoJSONResponse({
             "total": total,
             "nuevos_guardados": len(nuevos_guardados),
             "contactos": contactos,
             "pagination": {
                 "skip": skip,
                 "limit": limit,
-                "has_more": skip + limit < total
+                "has_more": token is not None if cursor else skip + limit < total,
+                "next_cursor": token
             },
             "stats": {
                 "by_channel": stats_by_channel,
                 "total_channels": len(stats_by_channel)
             }
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error en get_all_contacts_info: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from pymongo import UpdateOne
+
+from app.database.mongo import community_collection, member_collection
+
+
+# --- Contador materializado `community.members` ---
+async def increment_member_count(community_id: str, delta: int = 1):
+    """$inc atómico del contador; al restar nunca baja de 0."""
+    query = {"id": community_id}
+    if delta < 0:
+        query["members"] = {"$gte": -delta}
+    await community_collection.update_one(query, {"$inc": {"members": delta}})
+
+
+async def apply_member_counts(deltas: Counter):
+    """Aplica varios incrementos (community_id → delta) en un solo bulk_write."""
+    operations = [
+        UpdateOne({"id": community_id}, {"$inc": {"members": delta}})
+        for community_id, delta in deltas.items() if delta
+    ]
+    if operations:
+        await community_collection.bulk_write(operations, ordered=False)
+
+
+async def reconcile_member_counts() -> dict:
+    """
+    Recalcula todos los contadores con un solo $group sobre `members` y
+    corrige solo las comunidades cuyo valor guardado no coincide. Cada
+    corrección es condicional al valor leído: si un $inc llegó mientras tanto
+    se deja esa comunidad para la próxima pasada en lugar de pisarlo.
+    """
+    # Primero los contadores: un $inc posterior a esta lectura hace fallar su corrección
+    stored = {
+        community["_id"]: (community.get("id"), community.get("members"))
+        async for community in community_collection.find({}, {"id": 1, "members": 1})
+    }
+    pipeline = [{"$group": {"_id": "$community_id", "count": {"$sum": 1}}}]
+    counts = {doc["_id"]: doc["count"] async for doc in member_collection.aggregate(pipeline)}
+
+    operations = [
+        UpdateOne({"_id": _id, "members": members}, {"$set": {"members": counts.get(community_id, 0)}})
+        for _id, (community_id, members) in stored.items()
+        if members != counts.get(community_id, 0)
+    ]
+    fixed = 0
+    if operations:
+        fixed = (await community_collection.bulk_write(operations, ordered=False)).modified_count
+
+    print(f"👥 Contadores de miembros revisados: {len(stored)}, corregidos: {fixed}")
+    return {"checked": len(stored), "fixed": fixed}
+
+
+async def reconcile_on_startup():
+    """Lifespan: deja los contadores al día (los anteriores al contador no se mantenían)."""
+    try:
+        await reconcile_member_counts()
+    except Exception as e:
+        # Con contadores desfasados la app funciona; no se bloquea el arranque
+        print("⚠️ Error reconciliando contadores de miembros:", str(e))
@@ -1,7 +1,13 @@
-from fastapi import APIRouter
-from app.community.community_member.models import Member, MemberCreate, MemberListResponse, MemberUpdate, MemberResponse
+from fastapi import APIRouter, Depends
+from app.community.community_member.models import (
+    Member, MemberBulkCreate, MemberBulkResponse, MemberCreate, MemberListResponse, MemberUpdate, MemberResponse
+)
+from app.community.community_member.counts import apply_member_counts, increment_member_count
 from app.database.mongo import community_collection, member_collection
+from app.auth.jwt.jwt import get_current_user
 from fastapi import HTTPException, status, BackgroundTasks
+from collections import Counter
+from pymongo.errors import BulkWriteError
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from bson import ObjectId
 from datetime import datetime
@@ -164,6 +170,7 @@ async def create_member(
     try:
         # Insertar en la base de datos
         result = await member_collection.insert_one(new_member.dict())
+        await increment_member_count(member_data.community_id, 1)
         created_member = await member_collection.find_one({"_id": result.inserted_id})
         
         # Enviar correo en segundo plano
@@ -182,6 +189,75 @@ async def create_member(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al crear miembro: {str(e)}"
         )
+
+@router.post("/members/bulk",
+    response_model=MemberBulkResponse,
+    status_code=status.HTTP_201_CREATED,
+    description="Importa miembros en lote (omite emails ya registrados en su comunidad)"
+)
+async def bulk_create_members(
+    payload: MemberBulkCreate,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user(["admin"]))
+):
+    # 1. Emails ya registrados (una sola consulta) y repetidos dentro del lote
+    existing = member_collection.find(
+        {
+            "community_id": {"$in": list({m.community_id for m in payload.members})},
+            "email": {"$in": list({m.email for m in payload.members})}
+        },
+        {"community_id": 1, "email": 1}
+    )
+    seen = {(m["community_id"], m["email"]) async for m in existing}
+
+    new_members = []
+    skipped = []
+    for member_data in payload.members:
+        key = (member_data.community_id, member_data.email)
+        if key in seen:
+            skipped.append(member_data.email)
+            continue
+        seen.add(key)
+        new_members.append(member_data)
+
+    if not new_members:
+        return MemberBulkResponse(inserted=0, skipped=skipped)
+
+    # 2. Insertar y sumar a cada comunidad lo insertado en un solo bulk_write
+    registration_date = datetime.now().strftime("%d/%m/%Y")
+    failed = set()
+    error = None
+    try:
+        await member_collection.insert_many([
+            Member(**m.dict(), user_id=str(ObjectId()), registration_date=registration_date).dict()
+            for m in new_members
+        ], ordered=False)
+    except BulkWriteError as e:
+        # Con ordered=False se insertó todo lo que no aparece en writeErrors
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        error = e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar miembros: {str(e)}"
+        )
+
+    inserted = [m for i, m in enumerate(new_members) if i not in failed]
+    await apply_member_counts(Counter(m.community_id for m in inserted))
+
+    if payload.send_welcome:
+        for m in inserted:
+            background_tasks.add_task(
+                send_welcome_email, email=m.email, full_name=m.full_name, city=m.city, country=m.country
+            )
+
+    if error:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al importar miembros ({len(inserted)} insertados): {str(error)}"
+        )
+
+    return MemberBulkResponse(inserted=len(inserted), skipped=skipped)
         
 @router.get("/members/by-url/{community_url}",
     response_model=MemberListResponse,
@@ -334,14 +410,11 @@ async def delete_member(user_id: str):
             detail=f"No se encontró miembro con user_id: {user_id}"
         )
     
-    # 2. Actualizar contador en la comunidad (opcional)
+    # 2. Actualizar contador en la comunidad (si falla, lo corrige la reconciliación)
     try:
-        await community_collection.update_one(
-            {"id": member["community_id"]},
-            {"$inc": {"members": -1}}
-        )
-    except:
-        pass  # Si falla no interrumpimos la operación
+        await increment_member_count(member["community_id"], -1)
+    except Exception as e:
+        print("⚠️ Error actualizando contador de miembros:", str(e))
     
     return {
         "message": "Miembro eliminado correctamente",
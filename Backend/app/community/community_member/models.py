@@ -51,6 +51,14 @@ class MemberListResponse(BaseModel):
     members: List[MemberResponse]
     count: int
 
+class MemberBulkCreate(BaseModel):
+    members: List[MemberCreate] = Field(..., description="Miembros a importar")
+    send_welcome: bool = Field(default=False, description="Enviar correo de bienvenida a cada miembro")
+
+class MemberBulkResponse(BaseModel):
+    inserted: int
+    skipped: List[str] = Field(default_factory=list, description="Emails ya registrados en su comunidad")
+
 class MemberUpdate(BaseModel):
     full_name: Optional[str] = Field(None, description="Nombre completo")
     email: Optional[str] = Field(None, description="Email")
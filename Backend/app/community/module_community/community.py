@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, status
-from app.database.mongo import community_collection, member_collection
+from app.database.mongo import community_collection
 from app.community.module_community.models import CommunityResponse
 from app.community.module_community.upload_file import upload_image_to_s3
 from app.community.module_community.upload_file import delete_image_from_s3
 from fastapi.security import OAuth2PasswordBearer
 from app.auth.jwt.jwt import get_current_user
+from app.community.community_member.counts import reconcile_member_counts
 from fastapi import Depends
 from fastapi import Path
 from urllib.parse import urlparse
@@ -72,28 +73,20 @@ async def create_community_with_image(
 @router.get("/get-communities/", response_model=List[CommunityResponse])
 async def get_all_communities():
     """
-    Get all communities from the database with accurate member counts.
+    Get all communities from the database with their member counts.
     Returns:
-    - List of all communities with their full information, including verified member counts
+    - List of all communities with their full information. `members` is the
+      stored counter (kept on create/delete/bulk import and reconciled at startup)
     """
     try:
         communities = []
         async for community in community_collection.find():
-            # Get the actual count of members for this community
-            # Assuming you have a members collection or subcollection
-            actual_member_count = await member_collection.count_documents({
-                "community_id": community["id"]
-            })
-            
-            # Or if members are stored as an array in the community document:
-            # actual_member_count = len(community.get("members", []))
-            
             communities.append(CommunityResponse(
                 id=community["id"],
                 title=community["title"],
                 description=community["description"],
                 url=community["url"],
-                members=actual_member_count,  # Use the verified count
+                members=max(community.get("members") or 0, 0),
                 created_at=community["created_at"],
                 image=community.get("image_url") 
             ))
@@ -102,6 +95,18 @@ async def get_all_communities():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.post("/communities/reconcile-member-counts")
+async def reconcile_communities_member_counts(current_user: dict = Depends(get_current_user(["admin"]))):
+    """
+    Recalcula el contador `members` de todas las comunidades con un solo $group.
+    Returns:
+    - Comunidades revisadas y corregidas
+    """
+    try:
+        return await reconcile_member_counts()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.patch("/communities/{community_id}", response_model=CommunityResponse)
 async def update_community(
     community_id: str,
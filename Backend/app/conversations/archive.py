@@ -0,0 +1,291 @@
+"""
+Archivo frío de mensajes.
+
+Los mensajes más viejos que MESSAGE_ARCHIVE_AFTER_DAYS salen de `messages` y
+se guardan comprimidos (BSON + zlib) en `messages_archive`, en bloques de
+hasta MESSAGE_ARCHIVE_CHUNK mensajes por conversación. El contacto guarda en
+`archived_until` la fecha del mensaje archivado más reciente: el historial
+solo consulta el archivo cuando la página cruza esa frontera.
+
+Uso (cron, o el scheduler del lifespan con MESSAGE_ARCHIVE_ENABLED=true):
+    python -m app.conversations.archive run
+    python -m app.conversations.archive stats
+"""
+import asyncio
+import os
+import sys
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+import bson
+from bson import Binary
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+
+from app.core.pagination import decode_cursor
+from app.database.mongo import (
+    contacts_collection,
+    job_leases_collection,
+    messages_archive_collection,
+    messages_collection,
+)
+
+load_dotenv()
+
+# --- Configuración del archivo ---
+MESSAGE_ARCHIVE_ENABLED = os.getenv("MESSAGE_ARCHIVE_ENABLED", "false").lower() == "true"
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", 180))
+MESSAGE_ARCHIVE_CHUNK = int(os.getenv("MESSAGE_ARCHIVE_CHUNK", 500))
+MESSAGE_ARCHIVE_BATCH = int(os.getenv("MESSAGE_ARCHIVE_BATCH", 200))
+MESSAGE_ARCHIVE_INTERVAL = float(os.getenv("MESSAGE_ARCHIVE_INTERVAL", 6 * 3600))
+MESSAGE_ARCHIVE_COMPRESSION = int(os.getenv("MESSAGE_ARCHIVE_COMPRESSION", 6))
+
+ARCHIVE_CODEC = "bson+zlib"
+ARCHIVE_LEASE_ID = "message-archiver"
+
+
+def pack_messages(messages: list[dict]) -> Binary:
+    """BSON conserva ObjectId y datetime tal cual; zlib comprime el bloque."""
+    return Binary(zlib.compress(bson.encode({"messages": messages}), MESSAGE_ARCHIVE_COMPRESSION))
+
+
+def unpack_messages(chunk: dict) -> list[dict]:
+    return bson.decode(zlib.decompress(chunk["data"]))["messages"]
+
+
+def message_key(m: dict) -> tuple:
+    return m.get("timestamp") or datetime.min, m["_id"]
+
+
+def cursor_bounds(before: str = None, after: str = None) -> tuple:
+    """(before, after) como llaves (timestamp, _id) comparables con `message_key`."""
+    return (
+        decode_cursor(before) if before else None,
+        decode_cursor(after) if after else None,
+    )
+
+
+class MessageArchive:
+    """
+    Mueve mensajes viejos al archivo y los lee de vuelta para el historial.
+    Cada bloque se escribe antes de borrar sus mensajes de `messages`; si el
+    proceso se corta entre ambos pasos, la lectura descarta los repetidos por _id.
+    """
+
+    def __init__(self, collection=messages_archive_collection, messages=messages_collection,
+                 contacts=contacts_collection, leases=job_leases_collection):
+        self.collection = collection
+        self.messages = messages
+        self.contacts = contacts
+        self.leases = leases
+        self.owner = uuid.uuid4().hex
+        self._task: asyncio.Task | None = None
+        self.archived = 0
+        self.runs = 0
+
+    # --- Escritura ---
+    async def _write_chunk(self, contact_id, conversation_id: str, messages: list[dict]) -> int:
+        messages.sort(key=message_key)
+        await self.collection.insert_one({
+            "conversation_id": conversation_id,
+            "first_ts": messages[0].get("timestamp"),
+            "last_ts": messages[-1].get("timestamp"),
+            "count": len(messages),
+            "codec": ARCHIVE_CODEC,
+            "data": pack_messages(messages),
+            "archived_at": datetime.utcnow(),
+        })
+        result = await self.messages.delete_many({"_id": {"$in": [m["_id"] for m in messages]}})
+        await self.contacts.update_one(
+            {"_id": contact_id},
+            {"$max": {"archived_until": messages[-1].get("timestamp")}}
+        )
+        return result.deleted_count
+
+    async def archive_conversations(self, contact_ids: list, cutoff: datetime) -> int:
+        """Archiva los mensajes anteriores a `cutoff` de un lote de conversaciones."""
+        by_conversation = {str(_id): _id for _id in contact_ids}
+        archived = 0
+        current, chunk = None, []
+        # Mismo orden que el índice conversation_timestamp_id
+        cursor = self.messages.find(
+            {"conversation_id": {"$in": list(by_conversation)}, "timestamp": {"$lt": cutoff}}
+        ).sort([("conversation_id", 1), ("timestamp", -1), ("_id", -1)])
+        async for m in cursor:
+            if chunk and (m["conversation_id"] != current or len(chunk) >= MESSAGE_ARCHIVE_CHUNK):
+                archived += await self._write_chunk(by_conversation[current], current, chunk)
+                chunk = []
+            current = m["conversation_id"]
+            chunk.append(m)
+        if chunk:
+            archived += await self._write_chunk(by_conversation[current], current, chunk)
+        return archived
+
+    async def run_once(self, after_days: int = MESSAGE_ARCHIVE_AFTER_DAYS) -> int:
+        """Una pasada completa sobre los contactos. Retorna los mensajes archivados."""
+        cutoff = datetime.utcnow() - timedelta(days=after_days)
+        archived = 0
+        batch = []
+        async for contact in self.contacts.find({}, {"_id": 1}).sort("_id", 1):
+            batch.append(contact["_id"])
+            if len(batch) >= MESSAGE_ARCHIVE_BATCH:
+                archived += await self.archive_conversations(batch, cutoff)
+                batch = []
+        if batch:
+            archived += await self.archive_conversations(batch, cutoff)
+        self.archived += archived
+        self.runs += 1
+        print(f"🧊 Mensajes archivados (anteriores a {cutoff:%Y-%m-%d}): {archived}")
+        return archived
+
+    # --- Lectura ---
+    async def find(self, conversation_id: str, before: str = None, after: str = None,
+                   direction: int = -1, limit: int = 100, fields: dict | None = None) -> list[dict]:
+        """
+        Hasta `limit` mensajes archivados dentro de los cursores, en el orden
+        de `direction` (igual que el historial: (timestamp, _id)). Solo se
+        descomprimen los bloques que se cruzan con la ventana pedida.
+        """
+        before_key, after_key = cursor_bounds(before, after)
+        query = {"conversation_id": conversation_id}
+        if before_key:
+            query["first_ts"] = {"$lte": before_key[0]}
+        if after_key:
+            query["last_ts"] = {"$gte": after_key[0]}
+        sort = [("last_ts", -1)] if direction < 0 else [("first_ts", 1)]
+
+        found = {}
+        async for chunk in self.collection.find(query).sort(sort):
+            if len(found) >= limit:
+                # Los bloques que quedan son más viejos (o nuevos) que lo ya encontrado
+                edge = sorted(found.values(), key=message_key, reverse=direction < 0)[limit - 1]
+                if (direction < 0 and chunk["last_ts"] < edge["timestamp"]) or \
+                        (direction > 0 and chunk["first_ts"] > edge["timestamp"]):
+                    break
+            for m in unpack_messages(chunk):
+                if "duplicate_of" in m:
+                    continue
+                key = message_key(m)
+                if (before_key and key >= before_key) or (after_key and key <= after_key):
+                    continue
+                found[m["_id"]] = {k: m[k] for k in ("_id", *fields) if k in m} if fields else m
+
+        return sorted(found.values(), key=message_key, reverse=direction < 0)[:limit]
+
+    async def read_through(self, conversation_id: str, page: list[dict], limit: int, direction: int,
+                           before: str = None, after: str = None, archived_until: datetime = None,
+                           fields: dict | None = None) -> list[dict]:
+        """
+        Completa una página del historial (pedida con limit + 1) con el
+        archivo cuando la ventana cruza `archived_until`; si no, la deja igual.
+        """
+        if not archived_until:
+            return page
+        if direction < 0 and len(page) > limit and page[-1]["timestamp"] > archived_until:
+            return page
+        if direction > 0 and after and decode_cursor(after)[0] > archived_until:
+            return page
+        archived = await self.find(conversation_id, before, after, direction, limit + 1, fields)
+        merged = {m["_id"]: m for m in archived}
+        merged.update((m["_id"], m) for m in page)
+        return sorted(merged.values(), key=message_key, reverse=direction < 0)[:limit + 1]
+
+    async def stream(self, conversation_id: str, before: str = None, after: str = None,
+                     fields: dict | None = None):
+        """
+        Mensajes archivados en orden cronológico, un bloque descomprimido a la
+        vez. Los bloques repetidos (pasada interrumpida) solo se cruzan con los
+        ya emitidos desde su `first_ts`: solo esos _id se recuerdan.
+        """
+        before_key, after_key = cursor_bounds(before, after)
+        query = {"conversation_id": conversation_id}
+        if before_key:
+            query["first_ts"] = {"$lte": before_key[0]}
+        if after_key:
+            query["last_ts"] = {"$gte": after_key[0]}
+        recent: dict = {}  # _id → llave de lo emitido que un bloque posterior aún puede repetir
+        async for chunk in self.collection.find(query).sort([("first_ts", 1)]):
+            # Los bloques siguientes empiezan en first_ts o después
+            start = chunk.get("first_ts") or datetime.min
+            recent = {_id: key for _id, key in recent.items() if key[0] >= start}
+            for m in sorted(unpack_messages(chunk), key=message_key):
+                key = message_key(m)
+                if "duplicate_of" in m or m["_id"] in recent:
+                    continue
+                if (before_key and key >= before_key) or (after_key and key <= after_key):
+                    continue
+                recent[m["_id"]] = key
+                yield {k: m[k] for k in ("_id", *fields) if k in m} if fields else m
+
+    # --- Scheduler ---
+    async def _acquire_lease(self) -> bool:
+        """Un solo worker archiva a la vez (lease en `job_leases`)."""
+        now = datetime.utcnow()
+        try:
+            await self.leases.find_one_and_update(
+                {"_id": ARCHIVE_LEASE_ID, "$or": [{"lease_until": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner,
+                          "lease_until": now + timedelta(seconds=MESSAGE_ARCHIVE_INTERVAL)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._acquire_lease():
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("⚠️ Error archivando mensajes:", str(e))
+            await asyncio.sleep(MESSAGE_ARCHIVE_INTERVAL)
+
+    async def start(self):
+        if MESSAGE_ARCHIVE_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="message-archiver")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> dict:
+        pipeline = [{"$group": {
+            "_id": None,
+            "chunks": {"$sum": 1},
+            "messages": {"$sum": "$count"},
+            "bytes": {"$sum": {"$binarySize": "$data"}},
+        }}]
+        totals = await self.collection.aggregate(pipeline).to_list(length=1)
+        return {
+            "running": self._task is not None,
+            "after_days": MESSAGE_ARCHIVE_AFTER_DAYS,
+            "archived_by_worker": self.archived,
+            "runs": self.runs,
+            **({k: v for k, v in totals[0].items() if k != "_id"} if totals else
+               {"chunks": 0, "messages": 0, "bytes": 0}),
+        }
+
+
+message_archive = MessageArchive()
+
+
+async def main(command: str):
+    if command == "run":
+        await message_archive.run_once()
+    else:
+        print(await message_archive.stats())
+
+
+COMMANDS = ("run", "stats")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Uso: python -m app.conversations.archive [{'|'.join(COMMANDS)}]")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1]))
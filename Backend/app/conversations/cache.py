@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import Response
+
+load_dotenv()
+
+# --- Caché de la bandeja (primeras páginas de /get-conversations/) ---
+INBOX_CACHE_TTL = float(os.getenv("INBOX_CACHE_TTL", 3))
+# Solo se cachean páginas sin cursor con skip + limit <= este valor (0 = desactivado)
+INBOX_CACHE_MAX_ROWS = int(os.getenv("INBOX_CACHE_MAX_ROWS", 100))
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """`If-None-Match` puede traer varios ETags, débiles (W/) o `*`."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def json_response(body: bytes, if_none_match: str | None = None, headers: dict | None = None,
+                  etag: str | None = None) -> Response:
+    """Respuesta con ETag; 304 sin cuerpo si el cliente ya tiene esta versión."""
+    etag = etag or etag_for(body)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class InboxCache:
+    """
+    Caché en proceso de las primeras páginas de la bandeja, con TTL corto.
+    Las rutas que escriben contactos llaman `invalidate()` (write-through);
+    los cambios hechos en otros workers se ven al vencer el TTL.
+    """
+
+    def __init__(self, ttl: float = INBOX_CACHE_TTL, max_rows: int = INBOX_CACHE_MAX_ROWS):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.version = 0
+        self._entries: dict[tuple, dict] = {}
+        self._loading: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def cacheable(self, limit: int, skip: int, cursor: str | None) -> bool:
+        return self.ttl > 0 and not cursor and skip + limit <= self.max_rows
+
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def _fresh(self, key: tuple) -> dict | None:
+        entry = self._entries.get(key)
+        if entry and entry["expires"] > time.monotonic():
+            return entry
+        return None
+
+    async def get_or_load(self, key: tuple, loader) -> dict:
+        """
+        Entrada vigente para `key` o la carga con `loader()` → (body, headers).
+        Las peticiones concurrentes de la misma página comparten una sola carga;
+        si hubo una invalidación mientras cargaba, el resultado no se guarda.
+        """
+        entry = self._fresh(key)
+        if entry:
+            self.hits += 1
+            return entry
+        loading = self._loading.get(key)
+        if loading is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if not loading.cancelled():
+                    raise
+                # Cancelaron al que cargaba (no a este): se intenta de nuevo
+                return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        version = self.version
+        try:
+            body, headers = await loader()
+            entry = {
+                "body": body,
+                "etag": etag_for(body),
+                "headers": headers,
+                "expires": time.monotonic() + self.ttl,
+            }
+            if version == self.version:
+                self._entries[key] = entry
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            # Los que esperaban esta página no heredan la cancelación
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita el aviso de excepción no recuperada si nadie esperaba
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "entries": len(self._entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+inbox_cache = InboxCache()
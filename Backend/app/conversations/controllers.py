@@ -0,0 +1,123 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
+
+from app.database.mongo import messages_collection
+
+load_dotenv()
+
+# Ventana de mensajes recientes embebida en el contacto (0 = no embeber)
+CONTACT_RECENT_MESSAGES = int(os.getenv("CONTACT_RECENT_MESSAGES", 20))
+
+# Ventana (segundos) en la que dos mensajes iguales de Instagram son el mismo:
+# el envío desde el dashboard y su eco del webhook llegan con segundos de diferencia
+INSTAGRAM_DEDUP_WINDOW = int(os.getenv("INSTAGRAM_DEDUP_WINDOW", 5))
+
+
+def recent_messages_push(*entries: dict) -> dict:
+    """
+    Operador `$push` acotado para `contacts.messages`: conserva solo los
+    últimos CONTACT_RECENT_MESSAGES. Retorna {} si la ventana está desactivada.
+    """
+    if CONTACT_RECENT_MESSAGES <= 0 or not entries:
+        return {}
+    return {
+        "$push": {
+            "messages": {
+                "$each": list(entries),
+                "$slice": -CONTACT_RECENT_MESSAGES
+            }
+        }
+    }
+
+
+def last_message_fields(message: dict) -> dict:
+    """
+    Campos `$set` que denormalizan el último mensaje en el contacto
+    (`contacts.last_msg`), para que la bandeja se lea con una sola consulta.
+    `message` debe traer su `_id` ya generado.
+    """
+    return {
+        "last_msg": {
+            "message_id": message["_id"],
+            "sender": message.get("sender", ""),
+            "type": message.get("type", "text"),
+            "content": message.get("content", ""),
+            "timestamp": message.get("timestamp"),
+        }
+    }
+
+
+def message_dedup_key(message: dict) -> str:
+    """
+    Clave estable de un mensaje de Instagram: conversación, sender, contenido
+    y timestamp redondeado a INSTAGRAM_DEDUP_WINDOW segundos.
+    """
+    timestamp = message.get("timestamp")
+    window = ""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        window = int(timestamp.timestamp() // INSTAGRAM_DEDUP_WINDOW)
+    raw = f"{message.get('conversation_id')}|{message.get('sender', '')}|{message.get('content', '')}|{window}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def is_dedup_conflict(error: dict) -> bool:
+    return error.get("code") == 11000 and (
+        "dedup_key" in (error.get("keyPattern") or {}) or "dedup_key" in error.get("errmsg", "")
+    )
+
+
+def is_id_conflict(error: dict) -> bool:
+    return error.get("code") == 11000 and (
+        "_id" in (error.get("keyPattern") or {}) or "_id_" in error.get("errmsg", "")
+    )
+
+
+async def insert_messages(docs: list[dict]) -> int:
+    """
+    Inserta mensajes en `messages`. Los que traen `dedup_key` y chocan con el
+    índice único se guardan igual, marcados con `duplicate_of` (el historial
+    los excluye); los que chocan por `_id` ya estaban guardados y se omiten.
+    Retorna cuántos quedaron marcados como duplicados.
+    """
+    if not docs:
+        return 0
+    try:
+        await messages_collection.insert_many(docs, ordered=False)
+        return 0
+    except BulkWriteError as e:
+        errors = [err for err in e.details.get("writeErrors", []) if not is_id_conflict(err)]
+        if not all(is_dedup_conflict(err) for err in errors):
+            raise
+        if not errors:
+            return 0
+        duplicates = []
+        for err in errors:
+            doc = docs[err["index"]]
+            doc["duplicate_of"] = doc.pop("dedup_key")
+            duplicates.append(doc)
+            print(f"🚫 Duplicado de Instagram marcado: {doc.get('content', '')}")
+        await messages_collection.insert_many(duplicates, ordered=False)
+        return len(duplicates)
+
+
+async def latest_messages(conversation_ids: list[str]) -> dict[str, dict]:
+    """
+    Último mensaje de cada conversación en una sola agregación (para contactos
+    que aún no tienen `last_msg`). Usa el índice (conversation_id, timestamp).
+    """
+    if not conversation_ids:
+        return {}
+    pipeline = [
+        {"$match": {"conversation_id": {"$in": conversation_ids}}},
+        {"$sort": {"conversation_id": 1, "timestamp": -1}},
+        {"$group": {"_id": "$conversation_id", "last": {"$first": "$$ROOT"}}},
+    ]
+    latest = {}
+    async for doc in messages_collection.aggregate(pipeline):
+        latest[doc["_id"]] = doc["last"]
+    return latest
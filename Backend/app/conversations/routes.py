@@ -1,174 +1,230 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from app.database.mongo import contacts_collection, messages_collection
-from datetime import datetime, timedelta
+from app.conversations.controllers import latest_messages
+from app.conversations.cache import inbox_cache, json_response
+from app.conversations.archive import message_archive
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset_query, keyset_sort, next_cursor
+from app.core.serialization import CONTACT_PLAN, LAST_MESSAGE_PLAN, MESSAGE_PLAN, MongoJSONResponse, dumps
 from bson import ObjectId
-import pytz
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
 
 router = APIRouter()
 
-# --- Utilidad para limpiar documentos de Mongo ---
-def clean_mongo_doc(doc: dict) -> dict:
-    """Convierte ObjectId y datetime en tipos serializables (str) y ajusta hora a Bogotá."""
-    clean = {}
-    bogota_tz = pytz.timezone("America/Bogota")
-
-    for k, v in doc.items():
-        if isinstance(v, ObjectId):
-            clean[k] = str(v)
-        elif isinstance(v, datetime):
-            if v.tzinfo is not None:
-                bogota_time = v.astimezone(bogota_tz)
-            else:
-                utc_time = v.replace(tzinfo=pytz.UTC)
-                bogota_time = utc_time.astimezone(bogota_tz)
-
-            clean[k] = bogota_time.isoformat()
-            clean[f"{k}_pretty"] = bogota_time.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            clean[k] = v
-    return clean
-
-
-# --- Función para filtrar mensajes duplicados de Instagram EN MEMORIA ---
-def filter_instagram_duplicates_in_memory(messages: list):
-    """Filtra mensajes duplicados de Instagram solo en memoria, sin borrar de BD"""
-    if not messages:
-        return messages
-        
-    seen_messages = set()
-    unique_messages = []
-    duplicates_count = 0
-    
-    for msg in messages:
-        content = msg.get("content", "")
-        sender = msg.get("sender", "")
-        timestamp = msg.get("timestamp", "")
-        
-        # Crear clave única basada en contenido, sender y timestamp (con margen de 5 segundos)
-        if timestamp:
-            try:
-                # Parsear timestamp y redondear a 5 segundos
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                rounded_seconds = (dt.second // 5) * 5
-                timestamp_key = dt.replace(second=rounded_seconds, microsecond=0).isoformat()
-            except:
-                timestamp_key = timestamp[:19]  # Usar solo hasta segundos si hay error
-        else:
-            timestamp_key = ""
-            
-        message_key = f"{content}|{sender}|{timestamp_key}"
-        
-        if message_key in seen_messages:
-            duplicates_count += 1
-            print(f"🔍 Duplicado filtrado en memoria: {content}")
-        else:
-            seen_messages.add(message_key)
-            unique_messages.append(msg)
-    
-    if duplicates_count > 0:
-        print(f"✅ Filtrados {duplicates_count} mensajes duplicados de Instagram (solo en memoria)")
-    
-    return unique_messages
+# --- Historial de mensajes ---
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", 100))
+MESSAGES_PAGE_MAX = int(os.getenv("MESSAGES_PAGE_MAX", 500))
+MESSAGES_STREAM_BATCH = int(os.getenv("MESSAGES_STREAM_BATCH", 500))
+# Solo los campos que el historial devuelve (el _id va en los cursores)
+MESSAGE_PROJECTION = {"sender": 1, "content": 1, "timestamp": 1}
+
+def message_item(m: dict) -> dict:
+    """Mensaje ya limpio (MESSAGE_PLAN) en el formato del historial."""
+    return {
+        "sender": m.get("sender", ""),
+        "content": m.get("content", ""),
+        "timestamp": m.get("timestamp"),
+        "pretty_time": m.get("timestamp_pretty", "")
+    }
+
+
+def history_query(conversation_id: str, before: str = None, after: str = None) -> dict:
+    """
+    Mensajes de la conversación acotados por los cursores (timestamp, _id).
+    Los duplicados de Instagram se marcan al escribir (`duplicate_of`) y aquí se excluyen.
+    """
+    query = {"conversation_id": conversation_id, "duplicate_of": {"$exists": False}}
+    query = keyset_query(query, "timestamp", before, direction=-1)
+    return keyset_query(query, "timestamp", after, direction=1)
+
+
+async def stream_messages_ndjson(conversation_id: str, before: str = None, after: str = None,
+                                archived: bool = False):
+    """
+    Exporta el historial en orden cronológico, una línea JSON por mensaje, por
+    lotes del cursor. Con `archived` empieza por los mensajes del archivo frío
+    y sigue en `messages` después del último archivado exportado: si uno quedó
+    en ambos lados (pasada interrumpida) sale una vez, sin guardar sus _id.
+    """
+    if archived:
+        last_key = None
+        async for m in message_archive.stream(conversation_id, before, after, MESSAGE_PROJECTION):
+            if m.get("timestamp"):
+                last_key = (m["timestamp"], m["_id"])
+            m = MESSAGE_PLAN(m)
+            yield dumps({"_id": m["_id"], **message_item(m)}) + b"\n"
+        if last_key:
+            # El archivo respeta `after`, así que este cursor siempre es posterior
+            after = encode_cursor(*last_key)
+    cursor = (
+        messages_collection
+        .find(history_query(conversation_id, before, after), MESSAGE_PROJECTION)
+        .sort(keyset_sort("timestamp", 1))
+        .batch_size(MESSAGES_STREAM_BATCH)
+    )
+    async for m in cursor:
+        m = MESSAGE_PLAN(m)
+        yield dumps({"_id": m["_id"], **message_item(m)}) + b"\n"
 
 
 # --- Obtener todas las conversaciones (SOLO último mensaje) ---
+async def load_inbox_page(limit: int, skip: int, cursor: str = None) -> tuple[bytes, dict]:
+    """Página de la bandeja ya serializada: (cuerpo JSON, headers)."""
+    # 🔹 Orden descendente por (timestamp, _id) (estable); el último mensaje viene
+    # denormalizado en `last_msg`, así la bandeja es una sola consulta
+    query = keyset_query({"timestamp": {"$exists": True}}, "timestamp", cursor)
+    conversations_cursor = (
+        contacts_collection
+        .find(query, {"messages": 0})
+        .sort(keyset_sort("timestamp"))
+    )
+    if not cursor:
+        conversations_cursor = conversations_cursor.skip(skip)
+    conversations = await conversations_cursor.limit(limit).to_list(length=limit)
+
+    token = next_cursor(conversations, "timestamp", limit)
+
+    # Contactos sin `last_msg` (anteriores a la migración): una agregación para todos
+    fallback = await latest_messages([str(c["_id"]) for c in conversations if "last_msg" not in c])
+
+    results = []
+    for conv in conversations:
+        last_msg_doc = conv.pop("last_msg", None) or fallback.get(str(conv["_id"]))
+        conv = CONTACT_PLAN(conv)
+
+        user_id = conv.get("user_id")
+        if not user_id:
+            continue
+
+        # 🔹 Último mensaje asociado
+        last_msg = LAST_MESSAGE_PLAN(last_msg_doc) if last_msg_doc else None
+
+        results.append({
+            "_id": conv["_id"],
+            "user_id": user_id,
+            "name": conv.get("name", "Desconocido"),
+            "platform": conv.get("platform", ""),
+            "platform_icon": "🟢" if conv.get("platform") == "whatsapp" else "📘",
+            "last_message": last_msg.get("content") if last_msg else "",
+            "timestamp": last_msg.get("timestamp") if last_msg else None,
+            "pretty_time": last_msg.get("timestamp_pretty") if last_msg else "",
+            "unread": conv.get("unread", 0),
+            "estado": "Pendiente"
+        })
+
+    # 🔄 Aseguramos el orden final por timestamp
+    results.sort(key=lambda r: r.get("timestamp") or "", reverse=True)
+    return dumps(results), {NEXT_CURSOR_HEADER: token} if token else {}
+
+
 @router.get("/get-conversations/")
 async def get_all_conversations(
+    request: Request,
     limit: int = Query(30, description="Cantidad de conversaciones a devolver"),
-    skip: int = Query(0, description="Cantidad de conversaciones a omitir al inicio")
+    skip: int = Query(0, description="Cantidad de conversaciones a omitir al inicio"),
+    cursor: str = Query(None, description=f"Cursor de la página siguiente (header {NEXT_CURSOR_HEADER}); ignora skip")
 ):
+    """
+    Las primeras páginas salen de `inbox_cache` (TTL corto, invalidado en cada
+    escritura). Con `If-None-Match` igual al ETag vigente responde 304.
+    """
     try:
-        # 🔹 Orden descendente por timestamp (estable)
-        conversations_cursor = (
-            contacts_collection
-            .find({"timestamp": {"$exists": True}})
-            .sort("timestamp", -1)
-            .skip(skip)
-            .limit(limit)
-        )
-
-        results = []
-        async for conv in conversations_cursor:
-            conv = clean_mongo_doc(conv)
-
-            user_id = conv.get("user_id")
-            if not user_id:
-                continue
-
-            # 🔹 Último mensaje asociado
-            last_msg_doc = await messages_collection.find_one(
-                {"conversation_id": conv["_id"]},
-                sort=[("timestamp", -1)]
+        if_none_match = request.headers.get("if-none-match")
+        if inbox_cache.cacheable(limit, skip, cursor):
+            entry = await inbox_cache.get_or_load(
+                (limit, skip), lambda: load_inbox_page(limit, skip)
             )
-            last_msg = clean_mongo_doc(last_msg_doc) if last_msg_doc else None
-
-            results.append({
-                "_id": conv["_id"],
-                "user_id": user_id,
-                "name": conv.get("name", "Desconocido"),
-                "platform": conv.get("platform", ""),
-                "platform_icon": "🟢" if conv.get("platform") == "whatsapp" else "📘",
-                "last_message": last_msg.get("content") if last_msg else "",
-                "timestamp": last_msg.get("timestamp") if last_msg else None,
-                "pretty_time": last_msg.get("timestamp_pretty") if last_msg else "",
-                "unread": conv.get("unread", 0),
-                "estado": "Pendiente"
-            })
-
-        # 🔄 Aseguramos el orden final por timestamp
-        results.sort(key=lambda r: r.get("timestamp") or "", reverse=True)
-        return results
+            return json_response(entry["body"], if_none_match, entry["headers"], entry["etag"])
 
+        body, headers = await load_inbox_page(limit, skip, cursor)
+        return json_response(body, if_none_match, headers)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo conversaciones: {str(e)}")
 
-# --- Obtener todos los mensajes de una conversación específica ---
+# --- Historial de mensajes de una conversación (paginado por cursor o en stream) ---
 @router.get("/conversations/messages/{user_id}")
-async def get_messages_by_user(user_id: str):
+async def get_messages_by_user(
+    user_id: str,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_PAGE_MAX, description="Cantidad de mensajes a devolver"),
+    before: str = Query(None, description="Cursor: mensajes anteriores a este (cursors.before de la respuesta)"),
+    after: str = Query(None, description="Cursor: mensajes posteriores a este (cursors.after de la respuesta)"),
+    format: str = Query("json", description="json (página) | ndjson (stream con todo el historial, ignora limit)")
+):
     try:
-        conv = await contacts_collection.find_one({"user_id": user_id})
+        conv = await contacts_collection.find_one(
+            {"user_id": user_id}, {"name": 1, "platform": 1, "unread": 1, "last_msg": 1, "archived_until": 1}
+        )
         if not conv:
             raise HTTPException(status_code=404, detail="No se encontró conversación para este usuario.")
 
-        conv = clean_mongo_doc(conv)
-
-        msgs_cursor = messages_collection.find({"conversation_id": conv["_id"]}).sort("timestamp", 1)
-        all_messages = await msgs_cursor.to_list(length=None)
-        
-        # Limpiar todos los mensajes
-        cleaned_messages = [clean_mongo_doc(m) for m in all_messages]
-        
-        # ✅ SOLO PARA INSTAGRAM: Filtrar duplicados EN MEMORIA (sin borrar de BD)
-        if conv.get("platform") == "instagram":
-            final_messages = filter_instagram_duplicates_in_memory(cleaned_messages)
-            duplicates_removed = len(cleaned_messages) - len(final_messages)
-        else:
-            final_messages = cleaned_messages
-            duplicates_removed = 0
+        conversation_id = str(conv["_id"])
+        platform = conv.get("platform", "")
+
+        if format == "ndjson":
+            return StreamingResponse(
+                stream_messages_ndjson(conversation_id, before, after, "archived_until" in conv),
+                media_type="application/x-ndjson"
+            )
+        if format != "json":
+            raise HTTPException(status_code=400, detail="format debe ser json o ndjson")
+
+        # 🔹 Con solo `after` se avanza hacia adelante; si no, los N más recientes
+        # (antes de `before` si viene). Se pide uno de más para saber si hay otra página.
+        direction = 1 if after and not before else -1
+        page = await (
+            messages_collection
+            .find(history_query(conversation_id, before, after), MESSAGE_PROJECTION)
+            .sort(keyset_sort("timestamp", direction))
+            .limit(limit + 1)
+        ).to_list(length=limit + 1)
+        # Si la ventana cruza la frontera del archivo frío, se completa desde ahí
+        page = await message_archive.read_through(
+            conversation_id, page, limit, direction, before, after,
+            conv.get("archived_until"), MESSAGE_PROJECTION
+        )
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        if direction < 0:
+            page.reverse()
+
+        cursors = {
+            "before": encode_cursor(page[0]["timestamp"], page[0]["_id"]) if page else before,
+            "after": encode_cursor(page[-1]["timestamp"], page[-1]["_id"]) if page else after,
+        }
+
+        # Limpiar solo los mensajes de la página
+        final_messages = [MESSAGE_PLAN(m) for m in page]
+
+        # El último mensaje de la conversación viene denormalizado en el contacto
+        last_msg = LAST_MESSAGE_PLAN(conv["last_msg"]) if conv.get("last_msg") else (
+            final_messages[-1] if final_messages and direction < 0 and not before else {}
+        )
 
         response = {
             "user_id": user_id,
             "name": conv.get("name", ""),
-            "platform": conv.get("platform", ""),
-            "last_message": final_messages[-1]["content"] if final_messages else "",
-            "timestamp": final_messages[-1]["timestamp"] if final_messages else "",
-            "pretty_time": final_messages[-1].get("timestamp_pretty") if final_messages else "",
+            "platform": platform,
+            "last_message": last_msg.get("content", ""),
+            "timestamp": last_msg.get("timestamp", ""),
+            "pretty_time": last_msg.get("timestamp_pretty", ""),
             "unread": conv.get("unread", 0),
-            "messages": [
-                {
-                    "sender": m.get("sender", ""),
-                    "content": m.get("content", ""),
-                    "timestamp": m.get("timestamp"),
-                    "pretty_time": m.get("timestamp_pretty", "")
-                }
-                for m in final_messages
-            ],
+            "messages": [message_item(m) for m in final_messages],
             "total_messages": len(final_messages),
-            "duplicates_removed": duplicates_removed
+            "has_more": has_more,
+            "cursors": cursors
         }
 
-        return response
+        return MongoJSONResponse(response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
@@ -176,33 +232,30 @@ async def get_messages_by_user(user_id: str):
 # --- Endpoint adicional para ver duplicados sin eliminarlos ---
 @router.get("/conversations/check-duplicates/{user_id}")
 async def check_duplicates(user_id: str):
-    """Endpoint para verificar duplicados sin eliminarlos"""
+    """Endpoint para verificar duplicados sin eliminarlos (marcados al escribir con `duplicate_of`)"""
     try:
-        conv = await contacts_collection.find_one({"user_id": user_id})
+        conv = await contacts_collection.find_one({"user_id": user_id}, {"platform": 1})
         if not conv:
             raise HTTPException(status_code=404, detail="No se encontró conversación para este usuario.")
-        
-        msgs_cursor = messages_collection.find({"conversation_id": conv["_id"]}).sort("timestamp", 1)
-        all_messages = await msgs_cursor.to_list(length=None)
-        cleaned_messages = [clean_mongo_doc(m) for m in all_messages]
-        
-        if conv.get("platform") == "instagram":
-            final_messages = filter_instagram_duplicates_in_memory(cleaned_messages)
-            duplicates_count = len(cleaned_messages) - len(final_messages)
-        else:
-            final_messages = cleaned_messages
-            duplicates_count = 0
-        
+
+        conversation_id = str(conv["_id"])
+        total = await messages_collection.count_documents({"conversation_id": conversation_id})
+        duplicates_count = await messages_collection.count_documents(
+            {"conversation_id": conversation_id, "duplicate_of": {"$exists": True}}
+        )
+
         return {
             "status": "success",
             "user_id": user_id,
             "platform": conv.get("platform", ""),
-            "total_messages_in_db": len(all_messages),
+            "total_messages_in_db": total,
             "duplicates_detected": duplicates_count,
-            "unique_messages_to_display": len(final_messages),
+            "unique_messages_to_display": total - duplicates_count,
             "message": f"Se detectaron {duplicates_count} duplicados (solo en visualización)"
         }
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error verificando duplicados: {str(e)}")
 
@@ -215,5 +268,6 @@ async def marcar_gestionado(contact_id: str):
         {"$set": {"gestionado": True}}
     )
     if result.modified_count == 1:
+        inbox_cache.invalidate()
         return {"status": "ok", "contact_id": contact_id, "gestionado": True}
     return {"status": "not_found", "contact_id": contact_id}
\ No newline at end of file
@@ -0,0 +1,68 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+# Header con el cursor de la página siguiente en endpoints que devuelven listas
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(value, _id) -> str:
+    """Token opaco (base64 url-safe) con el valor de orden y el _id del último documento."""
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    elif isinstance(value, ObjectId):
+        value = {"$oid": str(value)}
+    raw = json.dumps({"v": value, "id": str(_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple:
+    """Retorna (valor, ObjectId). Un token inválido es un 400, no un 500."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = data["v"]
+        if isinstance(value, dict) and "$date" in value:
+            value = datetime.fromisoformat(value["$date"])
+        elif isinstance(value, dict) and "$oid" in value:
+            value = ObjectId(value["$oid"])
+        return value, ObjectId(data["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def keyset_query(query: dict, field: str, cursor: str | None, direction: int = -1) -> dict:
+    """
+    Agrega a `query` la condición "después del cursor" para un orden
+    (field, _id) en `direction`. El costo no depende de la profundidad.
+    """
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    if field == "_id":
+        condition = {"_id": {op: last_id}}
+    else:
+        condition = {"$or": [
+            {field: {op: value}},
+            {field: value, "_id": {op: last_id}},
+        ]}
+    return {"$and": [query, condition]} if query else condition
+
+
+def keyset_sort(field: str, direction: int = -1) -> list[tuple]:
+    if field == "_id":
+        return [("_id", direction)]
+    return [(field, direction), ("_id", direction)]
+
+
+def next_cursor(docs: list[dict], field: str, limit: int) -> str | None:
+    """Cursor de la página siguiente, o None si esta fue la última."""
+    if len(docs) < limit or not docs:
+        return None
+    last = docs[-1]
+    return encode_cursor(last["_id"] if field == "_id" else last.get(field), last["_id"])
@@ -0,0 +1,121 @@
+"""
+Serialización de documentos de Mongo para las respuestas de la API.
+
+- Zona horaria de Bogotá creada una sola vez y su offset cacheado por hora.
+- Planes por colección: cada plan sabe de antemano qué campos son ObjectId
+  y cuáles fechas, así no se inspecciona el tipo de cada valor del documento.
+- `MongoJSONResponse`: respuesta con orjson que serializa ObjectId y
+  datetime sin pasar por `jsonable_encoder`.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import orjson
+import pytz
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+BOGOTA_TZ = pytz.timezone("America/Bogota")
+_EPOCH = datetime(1970, 1, 1)
+_HOUR = timedelta(hours=1)
+
+
+@lru_cache(maxsize=4096)
+def _bogota_offset(utc_hour: int) -> tuple:
+    """
+    (offset, tzinfo) de Bogotá vigente en esa hora UTC. Los cambios de offset
+    caen en horas exactas, así que cachear por hora es exacto y evita el
+    `astimezone` de pytz (lo más costoso al serializar) en cada fecha.
+    """
+    local = pytz.UTC.localize(_EPOCH + utc_hour * _HOUR).astimezone(BOGOTA_TZ)
+    return local.utcoffset(), local.tzinfo
+
+
+def to_bogota(value: datetime) -> datetime:
+    """Las fechas de Mongo llegan sin tz (UTC); las aware se pasan a UTC primero."""
+    if value.tzinfo is not None:
+        value = value.astimezone(pytz.UTC).replace(tzinfo=None)
+    offset, tzinfo = _bogota_offset((value - _EPOCH) // _HOUR)
+    return (value + offset).replace(tzinfo=tzinfo)
+
+
+def format_datetime(value: datetime) -> tuple[str, str]:
+    """(isoformat en Bogotá, "YYYY-MM-DD HH:MM:SS") a partir de un solo isoformat."""
+    iso = to_bogota(value).isoformat()
+    return iso, iso[:19].replace("T", " ")
+
+
+def clean_mongo_doc(doc: dict) -> dict:
+    """Convierte ObjectId y datetime en tipos serializables (str) y ajusta hora a Bogotá."""
+    clean = {}
+    for k, v in doc.items():
+        if type(v) is ObjectId:
+            clean[k] = str(v)
+        elif isinstance(v, datetime):
+            clean[k], clean[f"{k}_pretty"] = format_datetime(v)
+        else:
+            clean[k] = v
+    return clean
+
+
+class DocumentPlan:
+    """
+    Plan precompilado para una colección: convierte solo los campos
+    declarados (con el mismo formato que `clean_mongo_doc`) y copia el resto.
+    """
+
+    def __init__(self, object_ids: tuple = ("_id",), datetimes: tuple = ()):
+        self.object_ids = tuple(object_ids)
+        self.datetimes = tuple((field, f"{field}_pretty") for field in datetimes)
+
+    def __call__(self, doc: dict) -> dict:
+        clean = dict(doc)
+        for field in self.object_ids:
+            value = clean.get(field)
+            if type(value) is ObjectId:
+                clean[field] = str(value)
+        for field, pretty in self.datetimes:
+            value = clean.get(field)
+            if isinstance(value, datetime):
+                clean[field], clean[pretty] = format_datetime(value)
+        return clean
+
+
+MESSAGE_PLAN = DocumentPlan(("_id",), ("timestamp",))
+CONTACT_PLAN = DocumentPlan(("_id",), ("timestamp", "created_at", "updated_at"))
+LAST_MESSAGE_PLAN = DocumentPlan(("message_id",), ("timestamp",))
+
+PLANS = {
+    "messages": MESSAGE_PLAN,
+    "contacts": CONTACT_PLAN,
+    "last_msg": LAST_MESSAGE_PLAN,
+}
+
+
+def serialize(collection: str, doc: dict) -> dict:
+    """Limpia `doc` con el plan de su colección (o campo a campo si no tiene)."""
+    plan = PLANS.get(collection)
+    return plan(doc) if plan else clean_mongo_doc(doc)
+
+
+def bson_default(value):
+    """Tipos que orjson no conoce; datetime lo serializa orjson directamente."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    """JSON (bytes) con ObjectId como str y fechas sin tz tratadas como UTC."""
+    return orjson.dumps(
+        content,
+        default=bson_default,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """Respuesta JSON con orjson; devolverla directamente evita `jsonable_encoder`."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware  # Importa el middleware CORS
 from dotenv import load_dotenv
@@ -12,13 +13,50 @@ from app.websocket.routes import router as ws_router
 from app.whatsapp_integration.routes import router as whatsapp_router
 from app.instagram_integration.routes import router as instagram_router
 from app.meta_webhook.routes import router as meta_webhook_router
+from app.meta_webhook.queue import webhook_queue, WEBHOOK_ASYNC_MODE
+from app.meta_webhook.replay import webhook_replayer
+from app.meta_webhook.media import media_pipeline
+from app.n8n.outbox import n8n_outbox
+from app.core.http_client import close_http_client
+from app.core.serialization import MongoJSONResponse
+from app.database.indexes import index_manager
+from app.websocket.fanout import fanout
+from app.websocket.connections import manager as ws_manager
 from app.facebook_integration.routes import router as facebook_router
-from app.conversations.routes import router as conversations_router 
+from app.conversations.routes import router as conversations_router
+from app.conversations.archive import message_archive
+from app.community.community_member.counts import reconcile_on_startup
+from app.search.routes import router as search_router
 # from app.ai_agent.main import router as agent_router
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🚀 Arranque: índices de Mongo, dispatcher de n8n y workers de ingestión del webhook
+    await index_manager.startup()
+    await reconcile_on_startup()
+    await n8n_outbox.start()
+    await fanout.start()
+    await ws_manager.start()
+    await message_archive.start()
+    if WEBHOOK_ASYNC_MODE:
+        await webhook_queue.start()
+    yield
+    # 🛑 Apagado: drenar la cola antes de cerrar
+    await webhook_replayer.stop()
+    await webhook_queue.stop()
+    await media_pipeline.drain()
+    await n8n_outbox.stop()
+    await fanout.stop()
+    await ws_manager.stop()
+    await message_archive.stop()
+    await close_http_client()
+
+
+# Todas las respuestas JSON salen por orjson (ObjectId y datetime incluidos)
+app = FastAPI(lifespan=lifespan, default_response_class=MongoJSONResponse)
 
 app.include_router(ws_router)
 app.include_router(meta_webhook_router)
@@ -33,7 +71,7 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos los headers
 )
 
-    
+
 # Incluye todos los routers
 app.include_router(login_router, prefix="/auth", tags=["Auth"])
 app.include_router(create_user_router, prefix="/auth", tags=["Create User"])
@@ -48,4 +86,5 @@ app.include_router(instagram_router, prefix="/instagram", tags=["Instagram Integ
 app.include_router(meta_webhook_router, prefix="/meta-webhook", tags=["Meta Webhook"])
 app.include_router(facebook_router, prefix="/facebook", tags=["Facebook Integration"])
 app.include_router(conversations_router, prefix="/conversations", tags=["Conversations"])
+app.include_router(search_router, prefix="/search", tags=["Search"])
 # app.include_router(agent_router, prefix="/agent", tags=["Agent"])
\ No newline at end of file
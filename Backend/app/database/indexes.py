@@ -0,0 +1,270 @@
+"""
+Registro declarativo de índices de MongoDB.
+
+Cada consulta caliente de la app tiene aquí su índice. El lifespan los crea
+(o solo los verifica, según MONGO_INDEX_MODE) y reporta los que faltan o no
+están declarados. El CLI revisa además con `explain()` las formas de consulta
+registradas y marca las que terminan en COLLSCAN; sale con código 1 si
+encuentra alguna, para usarlo en pruebas / CI contra una base de prueba.
+
+Uso:
+    python -m app.database.indexes ensure
+    python -m app.database.indexes report     (incluye índices sin uso según $indexStats)
+    python -m app.database.indexes explain
+"""
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.database.mongo import db
+from app.meta_webhook.dedup import DEDUP_TTL_SECONDS
+from app.meta_webhook.event_log import WEBHOOK_EVENT_TTL
+from app.n8n.outbox import N8N_DELIVERED_TTL
+from app.websocket.fanout import WS_FANOUT_TTL
+
+load_dotenv()
+
+# "create": crea los que falten | "check": solo reporta | "off": no toca índices
+MONGO_INDEX_MODE = os.getenv("MONGO_INDEX_MODE", "create").lower()
+
+# Conflictos de opciones / llaves al crear un índice con el mismo nombre
+INDEX_CONFLICT_CODES = (85, 86)
+# Índice único que no se puede crear porque ya hay documentos repetidos
+DUPLICATE_KEY_CODE = 11000
+
+
+class IndexSpec:
+    """Un índice declarado: colección, llaves, nombre y opciones de create_index."""
+
+    def __init__(self, collection: str, keys: list[tuple], name: str, **options):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.options = options
+
+    def __repr__(self):
+        return f"{self.collection}.{self.name}"
+
+
+INDEXES = [
+    # 📇 Contactos: upsert del webhook y envíos, bandeja, ManyChat
+    # Único: los workers de ingestión hacen upsert por (user_id, platform) en paralelo.
+    # Los contactos de ManyChat no tienen esos campos y quedan fuera del índice.
+    IndexSpec("contacts", [("user_id", ASCENDING), ("platform", ASCENDING)], "user_platform_unique",
+              unique=True,
+              partialFilterExpression={"user_id": {"$exists": True}, "platform": {"$exists": True}}),
+    IndexSpec("contacts", [("timestamp", DESCENDING), ("_id", DESCENDING)], "timestamp_id_desc"),
+    IndexSpec("contacts", [("subscriber_id", ASCENDING)], "subscriber_id", sparse=True),
+    # 🔎 Búsqueda por prefijos normalizados (multikey)
+    IndexSpec("contacts", [("search_prefixes", ASCENDING)], "search_prefixes"),
+    IndexSpec("messages", [("search_prefixes", ASCENDING)], "search_prefixes"),
+    # 💬 Historial por conversación y dedup de Instagram
+    IndexSpec("messages", [("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+              "conversation_timestamp_id"),
+    IndexSpec("messages", [("dedup_key", ASCENDING)], "dedup_key_unique", unique=True,
+              partialFilterExpression={"dedup_key": {"$exists": True}}),
+    # 🧊 Archivo frío de mensajes (bloques comprimidos por conversación)
+    IndexSpec("messages_archive", [("conversation_id", ASCENDING), ("last_ts", DESCENDING)],
+              "conversation_last_ts"),
+    IndexSpec("messages_archive", [("conversation_id", ASCENDING), ("first_ts", ASCENDING)],
+              "conversation_first_ts"),
+    # 📨 Mensajes de ManyChat (keepclient los recorre por fecha)
+    IndexSpec("message", [("timestamp", DESCENDING)], "timestamp_desc"),
+    # 🚨 Alertas
+    IndexSpec("alerts", [("status", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+              "status_timestamp_id"),
+    IndexSpec("alerts", [("conversation_id", ASCENDING), ("status", ASCENDING)], "conversation_status"),
+    # 👥 Comunidades y miembros
+    IndexSpec("community", [("url", ASCENDING)], "url"),
+    IndexSpec("community", [("id", ASCENDING)], "id"),
+    IndexSpec("members", [("community_id", ASCENDING), ("email", ASCENDING)], "community_email"),
+    IndexSpec("members", [("user_id", ASCENDING)], "user_id"),
+    # 🔐 Usuarios
+    IndexSpec("users", [("email", ASCENDING)], "email"),
+    IndexSpec("users", [("id", ASCENDING)], "id"),
+    # 📤 Outbox de n8n
+    IndexSpec("n8n_outbox", [("status", ASCENDING), ("next_attempt_at", ASCENDING)], "status_next_attempt"),
+    IndexSpec("n8n_outbox", [("delivered_at", ASCENDING)], "delivered_ttl", expireAfterSeconds=N8N_DELIVERED_TTL),
+    # 🪝 Webhook: dedup y log de eventos
+    IndexSpec("processed_events", [("created_at", ASCENDING)], "created_at_ttl",
+              expireAfterSeconds=DEDUP_TTL_SECONDS),
+    IndexSpec("webhook_events", [("received_at", ASCENDING)], "received_at_ttl",
+              expireAfterSeconds=WEBHOOK_EVENT_TTL),
+    IndexSpec("webhook_events", [("status", ASCENDING), ("received_at", ASCENDING)], "status_received_at"),
+    # 📡 Fanout de WebSocket entre workers
+    IndexSpec("ws_events", [("created_at", ASCENDING)], "created_at_ttl", expireAfterSeconds=WS_FANOUT_TTL),
+]
+
+# Formas de consulta calientes (valores de ejemplo) que deben resolverse con índice
+QUERY_SHAPES = [
+    ("contacts", {"user_id": "x", "platform": "whatsapp"}, None),
+    ("contacts", {"subscriber_id": "x"}, None),
+    ("contacts", {"timestamp": {"$exists": True}}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("messages", {"conversation_id": "x", "duplicate_of": {"$exists": False}},
+     [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("messages", {"dedup_key": "x"}, None),
+    ("contacts", {"search_prefixes": {"$all": ["x"]}}, None),
+    ("messages", {"search_prefixes": {"$all": ["x"]}}, None),
+    ("messages", {"conversation_id": {"$in": ["x", "y"]}, "timestamp": {"$lt": "x"}},
+     [("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("messages_archive", {"conversation_id": "x"}, [("last_ts", DESCENDING)]),
+    ("messages_archive", {"conversation_id": "x"}, [("first_ts", ASCENDING)]),
+    ("message", {}, [("timestamp", DESCENDING)]),
+    ("alerts", {"status": "pending"}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("alerts", {"conversation_id": "x", "status": {"$ne": "resolved"}}, None),
+    ("community", {"url": "x"}, None),
+    ("community", {"id": "x"}, None),
+    ("members", {"community_id": "x", "email": "x"}, None),
+    ("members", {"community_id": "x"}, None),
+    ("members", {"user_id": "x"}, None),
+    ("users", {"email": "x"}, None),
+    ("users", {"id": "x"}, None),
+    ("n8n_outbox", {"status": "pending"}, [("next_attempt_at", ASCENDING)]),
+    ("webhook_events", {"status": "failed"}, [("received_at", ASCENDING)]),
+]
+
+
+def plan_stages(plan) -> list[str]:
+    """Etapas de un plan de `explain()` (recorre inputStage / inputStages / queryPlan)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+class IndexManager:
+    def __init__(self, database=db, specs: list[IndexSpec] = INDEXES):
+        self.db = database
+        self.specs = specs
+
+    def collections(self) -> list[str]:
+        return list(dict.fromkeys(spec.collection for spec in self.specs))
+
+    async def _create(self, spec: IndexSpec) -> str:
+        collection = self.db[spec.collection]
+        try:
+            await collection.create_index(spec.keys, name=spec.name, **spec.options)
+            return "ok"
+        except OperationFailure as e:
+            if e.code == DUPLICATE_KEY_CODE:
+                print(f"⚠️ Índice único {spec} no creado: hay duplicados (ver app.database.migrations)")
+                return "duplicates"
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            if "expireAfterSeconds" in spec.options:
+                # Cambió el TTL por env: se ajusta sin reconstruir el índice
+                await self.db.command(
+                    "collMod", spec.collection,
+                    index={"name": spec.name, "expireAfterSeconds": spec.options["expireAfterSeconds"]}
+                )
+                return "ttl_updated"
+            print(f"⚠️ Índice {spec} en conflicto con uno existente: {e}")
+            return "conflict"
+
+    async def ensure(self, collections: list[str] | None = None) -> dict:
+        """Crea los índices declarados (idempotente). Retorna el resultado por índice."""
+        results = {}
+        for spec in self.specs:
+            if collections and spec.collection not in collections:
+                continue
+            results[repr(spec)] = await self._create(spec)
+        return results
+
+    async def report(self, usage: bool = False) -> dict:
+        """
+        Por colección: índices declarados que faltan, existentes que no están
+        declarados y (con `usage`) los que no registran accesos en $indexStats
+        desde el último reinicio del servidor.
+        """
+        report = {}
+        for name in self.collections():
+            collection = self.db[name]
+            existing = set(await collection.index_information()) - {"_id_"}
+            declared = {spec.name for spec in self.specs if spec.collection == name}
+            entry = {
+                "missing": sorted(declared - existing),
+                "undeclared": sorted(existing - declared),
+            }
+            if usage:
+                stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+                entry["unused"] = sorted(
+                    s["name"] for s in stats
+                    if s["name"] != "_id_" and s.get("accesses", {}).get("ops", 0) == 0
+                )
+            report[name] = entry
+        return report
+
+    async def explain(self, collection: str, query: dict, sort: list[tuple] | None = None) -> list[str]:
+        cursor = self.db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        return plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+
+    async def collscans(self, shapes=QUERY_SHAPES) -> list[dict]:
+        """Formas de consulta cuyo plan ganador recorre la colección completa."""
+        flagged = []
+        for collection, query, sort in shapes:
+            stages = await self.explain(collection, query, sort)
+            if "COLLSCAN" in stages:
+                flagged.append({"collection": collection, "query": query, "sort": sort, "stages": stages})
+        return flagged
+
+    async def startup(self):
+        """Lifespan: crea o verifica según MONGO_INDEX_MODE y reporta diferencias."""
+        if MONGO_INDEX_MODE == "off":
+            return
+        try:
+            if MONGO_INDEX_MODE == "create":
+                results = await self.ensure()
+                changed = {k: v for k, v in results.items() if v != "ok"}
+                if changed:
+                    print(f"🗂️ Índices con cambios: {changed}")
+            for name, entry in (await self.report()).items():
+                if entry["missing"]:
+                    print(f"⚠️ Índices faltantes en {name}: {entry['missing']}")
+                if entry["undeclared"]:
+                    print(f"ℹ️ Índices no declarados en {name}: {entry['undeclared']}")
+        except Exception as e:
+            # Sin índices la app funciona (más lenta); no se bloquea el arranque
+            print("⚠️ Error revisando índices de Mongo:", str(e))
+
+
+index_manager = IndexManager()
+
+
+async def main(command: str) -> int:
+    if command == "ensure":
+        for index, result in (await index_manager.ensure()).items():
+            print(f"  {index:<45} {result}")
+        return 0
+    if command == "report":
+        report = await index_manager.report(usage=True)
+        for name, entry in report.items():
+            print(f"  {name:<18} faltan={entry['missing']} no_declarados={entry['undeclared']} sin_uso={entry['unused']}")
+        return 1 if any(entry["missing"] for entry in report.values()) else 0
+    flagged = await index_manager.collscans()
+    for item in flagged:
+        print(f"❌ COLLSCAN en {item['collection']}: {item['query']} sort={item['sort']}")
+    if not flagged:
+        print("✅ Todas las consultas registradas usan índice")
+    return 1 if flagged else 0
+
+
+COMMANDS = ("ensure", "report", "explain")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Uso: python -m app.database.indexes [{'|'.join(COMMANDS)}]")
+        sys.exit(1)
+    sys.exit(asyncio.run(main(sys.argv[1])))
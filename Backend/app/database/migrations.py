@@ -0,0 +1,264 @@
+"""
+Migraciones de datos puntuales.
+
+Uso:
+    python -m app.database.migrations trim-contact-messages
+    python -m app.database.migrations backfill-last-message
+    python -m app.database.migrations flag-instagram-duplicates
+    python -m app.database.migrations backfill-search-tokens
+    python -m app.database.migrations merge-duplicate-contacts
+    python -m app.database.migrations reconcile-member-counts
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from app.database.mongo import contacts_collection, messages_archive_collection, messages_collection
+from app.database.indexes import index_manager
+from app.conversations.controllers import (
+    CONTACT_RECENT_MESSAGES,
+    is_dedup_conflict,
+    last_message_fields,
+    message_dedup_key,
+)
+from app.community.community_member.counts import reconcile_member_counts
+from app.search.controllers import CONTACT_SEARCH_FIELDS, contact_search_fields, message_search_fields
+
+
+async def trim_contact_messages(limit: int = CONTACT_RECENT_MESSAGES) -> int:
+    """
+    Recorta `contacts.messages` a los últimos `limit` mensajes (o lo elimina si
+    `limit` es 0). Se ejecuta en el servidor con un update por pipeline.
+    """
+    if limit <= 0:
+        result = await contacts_collection.update_many(
+            {"messages": {"$exists": True}},
+            {"$unset": {"messages": ""}}
+        )
+    else:
+        result = await contacts_collection.update_many(
+            {f"messages.{limit}": {"$exists": True}},
+            [{"$set": {"messages": {"$slice": ["$messages", -limit]}}}]
+        )
+    print(f"✂️ Contactos recortados: {result.modified_count}")
+    return result.modified_count
+
+
+async def backfill_last_message(batch_size: int = 500) -> int:
+    """
+    Completa `contacts.last_msg` para los contactos que no lo tienen, con el
+    último mensaje de cada conversación (una agregación agrupada por lotes).
+    """
+    await index_manager.ensure(["contacts", "messages"])
+    updated = 0
+    cursor = contacts_collection.find({"last_msg": {"$exists": False}}, {"_id": 1})
+    batch = []
+
+    async def flush():
+        nonlocal updated
+        pipeline = [
+            {"$match": {"conversation_id": {"$in": [str(c) for c in batch]}}},
+            {"$sort": {"conversation_id": 1, "timestamp": -1}},
+            {"$group": {"_id": "$conversation_id", "last": {"$first": "$$ROOT"}}},
+        ]
+        operations = []
+        async for doc in messages_collection.aggregate(pipeline):
+            try:
+                contact_id = ObjectId(doc["_id"])
+            except (InvalidId, TypeError):
+                continue
+            operations.append(UpdateOne(
+                {"_id": contact_id, "last_msg": {"$exists": False}},
+                {"$set": last_message_fields(doc["last"])}
+            ))
+        if operations:
+            result = await contacts_collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+        batch.clear()
+
+    async for contact in cursor:
+        batch.append(contact["_id"])
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    print(f"📬 Contactos con último mensaje completado: {updated}")
+    return updated
+
+
+async def flag_instagram_duplicates(batch_size: int = 200, write_batch: int = 1000) -> int:
+    """
+    Completa `dedup_key` en los mensajes históricos de Instagram y marca con
+    `duplicate_of` los repetidos (misma clave que uno anterior de la
+    conversación). Recorre las conversaciones por lotes y escribe con `bulk_write`.
+    """
+    await index_manager.ensure(["contacts", "messages"])
+    flagged = 0
+    keyed = 0
+
+    async def write(updates: list[tuple]):
+        """updates: (message_id, key, es_duplicado)"""
+        nonlocal flagged, keyed
+        operations = [
+            UpdateOne({"_id": _id}, {"$set": {"duplicate_of" if duplicate else "dedup_key": key}})
+            for _id, key, duplicate in updates
+        ]
+        conflicts = []
+        try:
+            await messages_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if not all(is_dedup_conflict(err) for err in errors):
+                raise
+            # La clave ya la tomó un mensaje escrito después del despliegue
+            conflicts = [updates[err["index"]] for err in errors]
+            await messages_collection.bulk_write([
+                UpdateOne({"_id": _id}, {"$set": {"duplicate_of": key}}) for _id, key, _ in conflicts
+            ], ordered=False)
+        duplicates = sum(1 for _, _, duplicate in updates if duplicate) + len(conflicts)
+        flagged += duplicates
+        keyed += len(updates) - duplicates
+
+    async def flush(conversation_ids: list[str]):
+        seen = set()
+        updates = []
+        cursor = messages_collection.find(
+            {
+                "conversation_id": {"$in": conversation_ids},
+                "dedup_key": {"$exists": False},
+                "duplicate_of": {"$exists": False},
+            },
+            {"conversation_id": 1, "sender": 1, "content": 1, "timestamp": 1}
+        ).sort([("conversation_id", 1), ("timestamp", 1), ("_id", 1)])
+        async for m in cursor:
+            key = message_dedup_key(m)
+            updates.append((m["_id"], key, key in seen))
+            seen.add(key)
+            if len(updates) >= write_batch:
+                await write(updates)
+                updates = []
+        if updates:
+            await write(updates)
+
+    batch = []
+    async for contact in contacts_collection.find({"platform": "instagram"}, {"_id": 1}):
+        batch.append(str(contact["_id"]))
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    print(f"📷 Mensajes de Instagram con clave: {keyed}, duplicados marcados: {flagged}")
+    return flagged
+
+
+async def backfill_search_tokens(batch_size: int = 1000) -> int:
+    """
+    Completa `search_tokens` / `search_prefixes` en los contactos y en los
+    mensajes de texto escritos antes de la búsqueda, con `bulk_write` por lotes.
+    """
+    await index_manager.ensure(["contacts", "messages"])
+    updated = 0
+
+    async def backfill(collection, query: dict, projection: dict, fields) -> int:
+        count = 0
+        operations = []
+        async for doc in collection.find(query, projection):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields(doc)}))
+            if len(operations) >= batch_size:
+                count += (await collection.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            count += (await collection.bulk_write(operations, ordered=False)).modified_count
+        return count
+
+    updated += await backfill(
+        contacts_collection,
+        {"search_tokens": {"$exists": False}},
+        {field: 1 for field in CONTACT_SEARCH_FIELDS},
+        contact_search_fields,
+    )
+    updated += await backfill(
+        messages_collection,
+        {"search_tokens": {"$exists": False}, "type": {"$in": ["text", None]}},
+        {"type": 1, "content": 1},
+        message_search_fields,
+    )
+
+    print(f"🔎 Documentos con campos de búsqueda completados: {updated}")
+    return updated
+
+
+async def merge_duplicate_contacts() -> int:
+    """
+    Fusiona los contactos repetidos por (user_id, platform) en el más antiguo:
+    mueve sus mensajes (también los archivados), suma el unread, conserva la
+    bandeja del más reciente y crea el índice único `user_platform_unique`.
+    """
+    pipeline = [
+        {"$match": {"user_id": {"$exists": True}, "platform": {"$exists": True}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "platform": "$platform"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    merged = 0
+    async for group in contacts_collection.aggregate(pipeline, allowDiskUse=True):
+        contacts = await contacts_collection.find(
+            {"_id": {"$in": group["ids"]}}, {"messages": 0}
+        ).sort("_id", 1).to_list(length=None)
+        keeper, duplicates = contacts[0], contacts[1:]
+        duplicate_ids = [c["_id"] for c in duplicates]
+
+        newest = max(contacts, key=lambda c: c.get("timestamp") or datetime.min)
+        update = {"$set": {
+            "unread": sum(c.get("unread") or 0 for c in contacts),
+            **{k: newest[k] for k in ("last_message", "timestamp", "last_msg", "name") if k in newest},
+        }}
+        archived_until = [c["archived_until"] for c in duplicates if c.get("archived_until")]
+        if archived_until:
+            update["$max"] = {"archived_until": max(archived_until)}
+        await contacts_collection.update_one({"_id": keeper["_id"]}, update)
+
+        moved = {"conversation_id": {"$in": [str(_id) for _id in duplicate_ids]}}
+        keep = {"$set": {"conversation_id": str(keeper["_id"])}}
+        await messages_collection.update_many(moved, keep)
+        await messages_archive_collection.update_many(moved, keep)
+        await contacts_collection.delete_many({"_id": {"$in": duplicate_ids}})
+        merged += len(duplicate_ids)
+
+    # El índice anterior (no único) tiene las mismas llaves y bloquea el nuevo
+    try:
+        await contacts_collection.drop_index("user_platform")
+    except OperationFailure:
+        pass
+    results = await index_manager.ensure(["contacts"])
+
+    print(f"👤 Contactos repetidos fusionados: {merged} ({results.get('contacts.user_platform_unique')})")
+    return merged
+
+
+MIGRATIONS = {
+    "trim-contact-messages": trim_contact_messages,
+    "backfill-last-message": backfill_last_message,
+    "flag-instagram-duplicates": flag_instagram_duplicates,
+    "backfill-search-tokens": backfill_search_tokens,
+    "reconcile-member-counts": reconcile_member_counts,
+    "merge-duplicate-contacts": merge_duplicate_contacts,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in MIGRATIONS:
+        print(f"Uso: python -m app.database.migrations [{'|'.join(MIGRATIONS)}]")
+        sys.exit(1)
+    asyncio.run(MIGRATIONS[sys.argv[1]]())
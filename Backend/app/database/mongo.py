@@ -20,6 +20,12 @@ community_collection = db["community"]
 user_collection = db["users"]
 member_collection = db["members"]
 messages_collection = db["messages"]
+n8n_outbox_collection = db["n8n_outbox"]
+processed_events_collection = db["processed_events"]
+webhook_events_collection = db["webhook_events"]
+ws_events_collection = db["ws_events"]
+messages_archive_collection = db["messages_archive"]
+job_leases_collection = db["job_leases"]
 
 # This function is no longer needed, but we keep it for compatibility
 def connect_to_mongo():
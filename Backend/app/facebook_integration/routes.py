@@ -7,9 +7,11 @@ from app.facebook_integration.controllers import (
 )
 from app.facebook_integration.models import MessengerSendMessage
 from app.database.mongo import contacts_collection, messages_collection
+from app.conversations.cache import inbox_cache
+from app.conversations.controllers import last_message_fields
+from app.search.controllers import contact_search_fields, message_search_fields
 from app.websocket.routes import notify_all
 from datetime import datetime, timezone
-import pytz
 from bson import ObjectId
 from pydantic import BaseModel
 from typing import Any, Tuple, List
@@ -18,7 +20,6 @@ import boto3
 
 
 router = APIRouter()
-bogota_tz = pytz.timezone("America/Bogota")
 
 
 # --- AWS S3 ---
@@ -74,27 +75,6 @@ def _parse_meta_response(resp: Any) -> Tuple[bool, int, dict]:
     return False, 500, {"error": "unknown_response", "raw": str(resp)}
 
 
-def clean_mongo_doc(doc: dict) -> dict:
-    """Limpiar documentos de Mongo para enviar al frontend"""
-    from bson import ObjectId as _OID
-
-    clean = {}
-    for k, v in doc.items():
-        if isinstance(v, _OID):
-            clean[k] = str(v)
-        elif isinstance(v, datetime):
-            if v.tzinfo is not None:
-                bogota_time = v.astimezone(bogota_tz)
-            else:
-                utc_time = v.replace(tzinfo=pytz.UTC)
-                bogota_time = utc_time.astimezone(bogota_tz)
-            clean[k] = bogota_time.isoformat()
-            clean[f"{k}_pretty"] = bogota_time.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            clean[k] = v
-    return clean
-
-
 # -----------------------
 # Enviar mensaje de texto
 # -----------------------
@@ -112,12 +92,21 @@ async def send_facebook_message(payload: MessengerSendMessage):
         user_id = payload.data.user_id
 
         # Obtener contacto
-        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "messenger"})
+        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "messenger"}, {"_id": 1})
         conversation_id = str(contact["_id"]) if contact else str(ObjectId())
 
         # Nombre del contacto
         nombre_contacto = (await get_messenger_user_name(user_id))["name"] or "Cliente"
 
+        message_doc = {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "sender": "system",
+            "type": "text",
+            "content": last_message,
+            "timestamp": now_utc,
+        }
+
         # Actualizar/crear contacto
         await contacts_collection.find_one_and_update(
             {"user_id": user_id, "platform": "messenger"},
@@ -125,21 +114,18 @@ async def send_facebook_message(payload: MessengerSendMessage):
                 "last_message": last_message,
                 "timestamp": now_utc,
                 "name": nombre_contacto,
+                **contact_search_fields({"name": nombre_contacto, "user_id": user_id}),
                 "conversation_id": conversation_id,
-                "unread": 0
+                "unread": 0,
+                **last_message_fields(message_doc)
             }},
+            projection={"_id": 1},
             upsert=True
         )
+        inbox_cache.invalidate()
 
         # Guardar mensaje en Mongo
-        message_doc = {
-            "conversation_id": conversation_id,
-            "sender": "system",
-            "type": "text",
-            "content": last_message,
-            "timestamp": now_utc,
-        }
-        await messages_collection.insert_one(message_doc)
+        await messages_collection.insert_one({**message_doc, **message_search_fields(message_doc)})
 
         # Notificar frontend
         ws_message = {
@@ -178,12 +164,21 @@ async def send_facebook_image_file(user_id: str, file: UploadFile = File(...)):
         response = await send_messenger_image(user_id, media_url_s3)
 
         # 3️⃣ Obtener contacto
-        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "messenger"})
+        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "messenger"}, {"_id": 1})
         conversation_id = str(contact["_id"]) if contact else str(ObjectId())
 
         # 4️⃣ Obtener nombre de contacto
         nombre_contacto = (await get_messenger_user_name(user_id))["name"] or "Cliente"
 
+        message_doc = {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "sender": "system",
+            "type": "image",
+            "content": media_url_s3,
+            "timestamp": now_utc,
+        }
+
         # 5️⃣ Actualizar/crear contacto
         await contacts_collection.find_one_and_update(
             {"user_id": user_id, "platform": "messenger"},
@@ -191,21 +186,18 @@ async def send_facebook_image_file(user_id: str, file: UploadFile = File(...)):
                 "last_message": "📷 Imagen",
                 "timestamp": now_utc,
                 "name": nombre_contacto,
+                **contact_search_fields({"name": nombre_contacto, "user_id": user_id}),
                 "conversation_id": conversation_id,
-                "unread": 0
+                "unread": 0,
+                **last_message_fields(message_doc)
             }},
+            projection={"_id": 1},
             upsert=True
         )
+        inbox_cache.invalidate()
 
         # 6️⃣ Guardar mensaje en Mongo
-        message_doc = {
-            "conversation_id": conversation_id,
-            "sender": "system",
-            "type": "image",
-            "content": media_url_s3,
-            "timestamp": now_utc,
-        }
-        await messages_collection.insert_one(message_doc)
+        await messages_collection.insert_one({**message_doc, **message_search_fields(message_doc)})
 
         # 7️⃣ Notificar frontend
         ws_message = {
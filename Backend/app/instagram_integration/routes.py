@@ -1,6 +1,9 @@
 # app/instagram_integration/routes.py
 from app.instagram_integration.controllers import send_instagram_message, send_instagram_image
-from app.database.mongo import contacts_collection, messages_collection
+from app.database.mongo import contacts_collection
+from app.conversations.cache import inbox_cache
+from app.conversations.controllers import insert_messages, last_message_fields, message_dedup_key
+from app.search.controllers import contact_search_fields, message_search_fields
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from datetime import datetime, timezone
 from bson import ObjectId
@@ -61,9 +64,18 @@ async def send_message_instagram(
         now_utc = utc_now()
         username = username or "Cliente Instagram"
 
-        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "instagram"})
+        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "instagram"}, {"_id": 1})
         conversation_id = str(contact["_id"]) if contact else str(ObjectId())
 
+        message_doc = {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "sender": "system",
+            "type": "text",
+            "content": text,
+            "timestamp": now_utc
+        }
+
         # 3️⃣ Actualizar contacto
         await contacts_collection.find_one_and_update(
             {"user_id": user_id, "platform": "instagram"},
@@ -71,23 +83,24 @@ async def send_message_instagram(
                 "last_message": text,
                 "timestamp": now_utc,
                 "name": username,
+                **contact_search_fields({"name": username, "user_id": user_id}),
                 "unread": 0,
                 "conversation_id": conversation_id,
-                "updated_at": now_utc
+                "updated_at": now_utc,
+                **last_message_fields(message_doc)
             },
             "$setOnInsert": {"created_at": now_utc}},
+            projection={"_id": 1},
             upsert=True
         )
+        inbox_cache.invalidate()
 
-        # 4️⃣ Guardar mensaje en Mongo (una sola vez)
-        message_doc = {
-            "conversation_id": conversation_id,
-            "sender": "system",
-            "type": "text",
-            "content": text,
-            "timestamp": now_utc
-        }
-        await messages_collection.insert_one(message_doc)
+        # 4️⃣ Guardar mensaje en Mongo (una sola vez; si el eco ya llegó queda marcado como duplicado)
+        await insert_messages([{
+            **message_doc,
+            **message_search_fields(message_doc),
+            "dedup_key": message_dedup_key(message_doc)
+        }])
 
         return {
             "status": "success",
@@ -131,9 +144,18 @@ async def send_instagram_image_file(
         await send_instagram_image(user_id, media_url_s3, is_url=True)
 
         # 4️⃣ Procesar contacto y conversación
-        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "instagram"})
+        contact = await contacts_collection.find_one({"user_id": user_id, "platform": "instagram"}, {"_id": 1})
         conversation_id = str(contact["_id"]) if contact else str(ObjectId())
 
+        message_doc = {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "sender": "system",
+            "type": "image",
+            "content": media_url_s3,
+            "timestamp": now_utc
+        }
+
         # 5️⃣ Actualizar contacto
         await contacts_collection.find_one_and_update(
             {"user_id": user_id, "platform": "instagram"},
@@ -141,23 +163,24 @@ async def send_instagram_image_file(
                 "last_message": "📷 Imagen",
                 "timestamp": now_utc,
                 "name": username,
+                **contact_search_fields({"name": username, "user_id": user_id}),
                 "unread": 0,
                 "conversation_id": conversation_id,
-                "updated_at": now_utc
+                "updated_at": now_utc,
+                **last_message_fields(message_doc)
             },
             "$setOnInsert": {"created_at": now_utc}},
+            projection={"_id": 1},
             upsert=True
         )
+        inbox_cache.invalidate()
 
         # 6️⃣ Guardar mensaje en Mongo (una sola vez)
-        message_doc = {
-            "conversation_id": conversation_id,
-            "sender": "system",
-            "type": "image",
-            "content": media_url_s3,
-            "timestamp": now_utc
-        }
-        await messages_collection.insert_one(message_doc)
+        await insert_messages([{
+            **message_doc,
+            **message_search_fields(message_doc),
+            "dedup_key": message_dedup_key(message_doc)
+        }])
 
         return {
             "status": "success",
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from datetime import datetime
 from app.manychat.controllers import get_subscriber_info
 from app.database.mongo import contacts_collection
+from app.search.controllers import contact_search_fields
 
 router = APIRouter()
 
@@ -71,7 +72,7 @@ async def fetch_and_save_subscriber(subscriber_id: int):
         print("Intentando guardar en MongoDB...")
         result = await contacts_collection.update_one(
             {"subscriber_id": contact_doc["subscriber_id"]},
-            {"$set": contact_doc},
+            {"$set": {**contact_doc, **contact_search_fields(contact_doc)}},
             upsert=True
         )
 
@@ -1,4 +1,4 @@
-import httpx
+from app.core.http_client import get_http_client
 import os
 
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
@@ -9,14 +9,13 @@ async def get_instagram_username(user_id: str) -> str | None:
         "fields": "username",
         "access_token": PAGE_ACCESS_TOKEN
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("username")
-        else:
-            print("⚠️ Error consultando username:", response.text)
-            return None
+    response = await get_http_client().get(url, params=params)
+    if response.status_code == 200:
+        data = response.json()
+        return data.get("username")
+    else:
+        print("⚠️ Error consultando username:", response.text)
+        return None
 
 async def get_messenger_user(psid: str) -> dict | None:
     """
@@ -28,11 +27,9 @@ async def get_messenger_user(psid: str) -> dict | None:
         "fields": "first_name,last_name,profile_pic",
         "access_token": PAGE_ACCESS_TOKEN
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print("⚠️ Error consultando Messenger user:", response.text)
-            return None
-
+    response = await get_http_client().get(url, params=params)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print("⚠️ Error consultando Messenger user:", response.text)
+        return None
@@ -0,0 +1,100 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
+
+from app.database.mongo import processed_events_collection
+
+load_dotenv()
+
+DEDUP_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUP_TTL", 7 * 24 * 3600))
+DEDUP_LRU_SIZE = int(os.getenv("WEBHOOK_DEDUP_LRU_SIZE", 50000))
+
+
+class DedupStore:
+    """
+    Deduplicación de mensajes del webhook por id de plataforma (wamid / mid).
+    La fuente de verdad es Mongo (`_id` único + índice TTL), compartida entre
+    procesos y reinicios; delante hay un LRU acotado en memoria para que los
+    reintentos recientes se descarten sin ida a la base.
+    """
+
+    def __init__(self, collection=processed_events_collection,
+                 max_size: int = DEDUP_LRU_SIZE, ttl: int = DEDUP_TTL_SECONDS):
+        self.collection = collection
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lru: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str):
+        self._lru[key] = time.monotonic() + self.ttl
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _seen_locally(self, key: str) -> bool:
+        expires = self._lru.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._lru[key]
+            return False
+        self._lru.move_to_end(key)
+        return True
+
+    async def seen_many(self, items: list[tuple[str, str | None]]) -> list[bool]:
+        """
+        Registra los mensajes de una entrega completa con un solo `insert_many`
+        para todas las claves que no están en el LRU. Retorna un flag de
+        duplicado por cada (plataforma, id); sin id no se deduplica y se deja pasar.
+        """
+        flags = [False] * len(items)
+        pending: dict[str, int] = {}
+        for i, (platform, message_id) in enumerate(items):
+            if not message_id:
+                continue
+            key = f"{platform}:{message_id}"
+            if key in pending or self._seen_locally(key):
+                flags[i] = True
+                continue
+            pending[key] = i
+
+        if pending:
+            now = datetime.utcnow()
+            keys = list(pending)
+            docs = [
+                {"_id": key, "platform": key.split(":", 1)[0], "created_at": now}
+                for key in keys
+            ]
+            try:
+                await self.collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    if error.get("code") == 11000:
+                        flags[pending[keys[error["index"]]]] = True
+            except Exception as e:
+                print("⚠️ Error registrando mensajes en dedup:", str(e))
+                return flags
+            for key in keys:
+                self._remember(key)
+
+        duplicates = sum(flags)
+        self.hits += duplicates
+        self.misses += len(items) - duplicates
+        return flags
+
+    def stats(self) -> dict:
+        return {
+            "lru_size": len(self._lru),
+            "lru_max_size": self.max_size,
+            "duplicates": self.hits,
+            "unique": self.misses,
+        }
+
+
+dedup_store = DedupStore()
@@ -0,0 +1,123 @@
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING
+
+from app.database.mongo import webhook_events_collection
+
+load_dotenv()
+
+WEBHOOK_EVENT_TTL = int(os.getenv("WEBHOOK_EVENT_TTL", 14 * 24 * 3600))
+EVENT_STATUSES = ("received", "processed", "failed")
+
+
+class WebhookEventLog:
+    """
+    Registro crudo de las entregas del webhook (TTL en Mongo).
+    Cada entrega se guarda antes de procesarse y lleva su estado:
+    `received` → `processed` | `failed` (con la etapa y el error), para poder
+    reprocesarla después y como corpus de tráfico real para el benchmark.
+    """
+
+    def __init__(self, collection=webhook_events_collection, ttl: int = WEBHOOK_EVENT_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self.logged = 0
+        self.log_errors = 0
+
+    async def append(self, body: dict) -> dict:
+        """
+        Guarda la entrega y retorna el evento `{_id, payload}`. Si Mongo falla
+        el evento queda sin `_id` y se procesa igual (no se pierde el mensaje).
+        """
+        event = {
+            "payload": body,
+            "object": body.get("object"),
+            "status": "received",
+            "attempts": 0,
+            "received_at": datetime.utcnow(),
+        }
+        try:
+            result = await self.collection.insert_one(event)
+            self.logged += 1
+            return {"_id": result.inserted_id, "payload": body}
+        except Exception as e:
+            self.log_errors += 1
+            print("⚠️ Error guardando evento del webhook:", str(e))
+            return {"_id": None, "payload": body}
+
+    async def mark_processed(self, event_id: ObjectId | None, messages: int):
+        if event_id is None:
+            return
+        # Si un trabajo de media ya falló, el evento se queda en `failed`
+        await self.collection.update_one(
+            {"_id": event_id, "stage": {"$ne": "media"}},
+            {"$set": {"status": "processed", "messages": messages, "processed_at": datetime.utcnow()},
+             "$inc": {"attempts": 1},
+             "$unset": {"error": "", "stage": ""}},
+        )
+
+    async def mark_failed(self, event_id: ObjectId | None, stage: str, error: str,
+                          media_jobs: list[dict] | None = None):
+        """
+        Marca el evento como fallido. `stage` es `ingest` (se reprocesa la
+        entrega completa) o `media` (solo se reintentan `media_jobs`).
+        """
+        if event_id is None:
+            return
+        update = {"status": "failed", "stage": stage, "error": error, "failed_at": datetime.utcnow()}
+        operation = {"$set": update}
+        if stage == "ingest":
+            operation["$inc"] = {"attempts": 1}
+        if media_jobs:
+            operation["$push"] = {"media_jobs": {"$each": media_jobs}}
+        try:
+            await self.collection.update_one({"_id": event_id}, operation)
+        except Exception as e:
+            print("⚠️ Error marcando evento del webhook como fallido:", str(e))
+
+    async def media_recovered(self, event_id: ObjectId, message_id: ObjectId):
+        """Quita el trabajo de media reintentado y cierra el evento si no quedan más."""
+        await self.collection.update_one(
+            {"_id": event_id}, {"$pull": {"media_jobs": {"message_id": message_id}}}
+        )
+        await self.collection.update_one(
+            {"_id": event_id, "stage": "media", "media_jobs": {"$size": 0}},
+            {"$set": {"status": "processed", "processed_at": datetime.utcnow()},
+             "$unset": {"error": "", "stage": "", "media_jobs": ""}},
+        )
+
+    def build_query(self, status: str | None = None, since: datetime | None = None,
+                    until: datetime | None = None) -> dict:
+        query: dict = {}
+        if status:
+            query["status"] = status
+        if since or until:
+            query["received_at"] = {}
+            if since:
+                query["received_at"]["$gte"] = since
+            if until:
+                query["received_at"]["$lt"] = until
+        return query
+
+    async def find_ids(self, query: dict, limit: int) -> list[ObjectId]:
+        """Ids que cumplen `query`, del más antiguo al más reciente."""
+        cursor = self.collection.find(query, {"_id": 1}).sort("received_at", ASCENDING).limit(limit)
+        return [doc["_id"] async for doc in cursor]
+
+    async def stats(self) -> dict:
+        counts = {
+            status: await self.collection.count_documents({"status": status})
+            for status in EVENT_STATUSES
+        }
+        return {
+            **counts,
+            "ttl_seconds": self.ttl,
+            "logged_by_worker": self.logged,
+            "log_errors": self.log_errors,
+        }
+
+
+webhook_event_log = WebhookEventLog()
@@ -0,0 +1,509 @@
+from app.database.mongo import contacts_collection, messages_collection
+from app.conversations.cache import inbox_cache
+from app.conversations.controllers import (
+    insert_messages,
+    last_message_fields,
+    message_dedup_key,
+    recent_messages_push,
+)
+from app.websocket.routes import notify_all
+from app.meta_webhook.dedup import dedup_store
+from app.meta_webhook.event_log import webhook_event_log
+from app.meta_webhook.media import (
+    WHATSAPP_MEDIA_TYPES,
+    media_extension,
+    media_pipeline,
+    stream_whatsapp_media_to_s3,
+)
+from app.meta_webhook.profiles import resolve_instagram_name, resolve_messenger_name
+from app.n8n.outbox import enqueue_n8n, enqueue_n8n_many
+from app.search.controllers import contact_search_fields, message_search_fields
+from app.core.serialization import BOGOTA_TZ
+from bson import ObjectId
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import os
+from dotenv import load_dotenv
+import hashlib
+
+
+load_dotenv()
+
+CONVERSATION_ID_CACHE_SIZE = int(os.getenv("CONVERSATION_ID_CACHE_SIZE", 20000))
+
+PLATFORM_LABELS = {"whatsapp": "WhatsApp", "messenger": "Messenger", "instagram": "Instagram"}
+N8N_URL_ENV = {
+    "whatsapp": "N8N_WEBHOOK_URL_WHATSAPP",
+    "messenger": "N8N_WEBHOOK_URL_FACEBOOK",
+    "instagram": "N8N_WEBHOOK_URL_INSTAGRAM",
+}
+
+# (platform, user_id) → _id del contacto. El _id de un contacto no cambia,
+# así que con el cache caliente una entrega cuesta bulk_write + insert_many.
+conversation_ids: OrderedDict[tuple, ObjectId] = OrderedDict()
+
+
+def get_message_hash(user_id: str, content: str, timestamp: int) -> str:
+    """Crear hash único para mensajes que llegan sin id de plataforma"""
+    combined = f"{user_id}:{content}:{timestamp}"
+    return hashlib.md5(combined.encode()).hexdigest()
+
+
+def message_oid(r: dict) -> ObjectId:
+    """
+    _id del mensaje derivado del id de plataforma (wamid / mid): reprocesar la
+    misma entrega produce el mismo _id, así que no se puede guardar dos veces.
+    Sin id de plataforma se genera uno nuevo.
+    """
+    if not r["message_id"]:
+        return ObjectId()
+    raw = f"{r['platform']}:{r['message_id']}".encode()
+    return ObjectId(hashlib.blake2b(raw, digest_size=12).digest())
+
+
+async def drop_persisted(records: list[dict]) -> list[dict]:
+    """Descarta los registros cuyo mensaje ya está en `messages` (o repetidos en la entrega)."""
+    by_oid = {}
+    for r in records:
+        r["message_oid"] = message_oid(r)
+        by_oid.setdefault(r["message_oid"], r)
+    cursor = messages_collection.find({"_id": {"$in": list(by_oid)}}, {"_id": 1})
+    async for doc in cursor:
+        r = by_oid.pop(doc["_id"])
+        print(f"🚫 Mensaje ya guardado, se omite en el replay: {r['user_id']}: {r['content']}")
+    return list(by_oid.values())
+
+
+def remember_conversation_id(key: tuple, conversation_id: ObjectId):
+    conversation_ids[key] = conversation_id
+    conversation_ids.move_to_end(key)
+    if len(conversation_ids) > CONVERSATION_ID_CACHE_SIZE:
+        conversation_ids.popitem(last=False)
+
+
+# --- Media de WhatsApp (fuera del camino crítico) ---
+async def finalize_whatsapp_media(
+    message_id, conversation_id: str, wa_id: str, profile_name: str,
+    media_id: str, mime_type: str, msg_type: str, key: str, received_at: datetime
+):
+    """Sube la media a S3 por streaming y completa el mensaje ya guardado."""
+    try:
+        content = await stream_whatsapp_media_to_s3(media_id, key, mime_type)
+    except Exception:
+        await messages_collection.update_one(
+            {"_id": message_id}, {"$set": {"media_status": "failed"}}
+        )
+        raise
+
+    await messages_collection.update_one(
+        {"_id": message_id},
+        {"$set": {"content": content, "media_status": "ready"}}
+    )
+    # Si sigue siendo el último mensaje de la conversación, completar la bandeja
+    await contacts_collection.update_one(
+        {"_id": ObjectId(conversation_id), "last_msg.message_id": message_id},
+        {"$set": {"last_msg.content": content}}
+    )
+    inbox_cache.invalidate()
+
+    # Mismo `message_id` que el evento pendiente: el front actualiza esa burbuja
+    await notify_all({
+        "event": "media_ready",
+        "message_id": str(message_id),
+        "user_id": wa_id,
+        "conversation_id": conversation_id,
+        "platform": "whatsapp",
+        "type": msg_type,
+        "content": content,
+        "media_url": content,
+        "timestamp": received_at.isoformat(),
+        "direction": "inbound",
+        "remitente": profile_name
+    })
+    print(f"[WhatsApp] {profile_name}: {content}")
+
+    try:
+        n8n_url = os.getenv("N8N_WEBHOOK_URL_WHATSAPP")
+        payload = {
+            "user_id": wa_id,
+            "name": profile_name,
+            "type": msg_type,
+            "content": content,
+            "timestamp": received_at.isoformat(),
+            "bot_active": bool(True)
+        }
+        await enqueue_n8n(n8n_url, payload)
+        print("📤 Encolado para n8n:", payload)
+    except Exception as e:
+        print("⚠️ Error enviando a n8n:", str(e))
+
+
+async def run_media_job(event_id: ObjectId | None, job: dict):
+    """Ejecuta `finalize_whatsapp_media` y deja el trabajo en el evento si falla."""
+    try:
+        await finalize_whatsapp_media(**job)
+    except Exception as e:
+        await webhook_event_log.mark_failed(event_id, "media", str(e) or type(e).__name__, [job])
+        raise
+
+
+# --- Parseo de la entrega en registros normalizados ---
+def parse_whatsapp_entry(entry: dict) -> list[dict]:
+    """📲 WHATSAPP: un registro por mensaje soportado."""
+    records = []
+    for change in entry.get("changes", []):
+        value = change.get("value", {})
+        for msg in value.get("messages", []):
+            wa_id = msg.get("from")
+            profile_name = value.get("contacts", [{}])[0].get("profile", {}).get("name", wa_id)
+            record = {
+                "platform": "whatsapp",
+                "user_id": wa_id,
+                "name": profile_name,
+                "message_id": msg.get("id"),
+                "is_echo": False,
+                "received_at": datetime.now(BOGOTA_TZ),
+                "media": None,
+                "notify": True,
+                "forward": True,
+            }
+
+            if "text" in msg:
+                content = msg["text"]["body"]
+                record.update(msg_type="text", content=content, text_for_front=content)
+
+            elif msg.get("type") in WHATSAPP_MEDIA_TYPES:
+                # 📎 La descarga/subida ocurre en el pipeline de media;
+                # n8n recibe la media cuando el pipeline termina
+                msg_type = msg["type"]
+                media = msg[msg_type]
+                mime_type = media.get("mime_type", "application/octet-stream")
+                ext = media_extension(mime_type, media.get("filename"))
+                record.update(msg_type=msg_type, content="", text_for_front="📎 Archivo", forward=False)
+                record["media"] = {
+                    "media_id": media["id"],
+                    "mime_type": mime_type,
+                    "key": f"whatsapp/{wa_id}/{media['id']}.{ext}",
+                }
+
+            else:
+                continue
+
+            records.append(record)
+    return records
+
+
+def parse_messaging_event(event: dict, platform: str) -> dict | None:
+    """💬 MESSENGER / 📷 INSTAGRAM: normaliza un evento de `messaging`."""
+    sender_id = event.get("sender", {}).get("id")
+    recipient_id = event.get("recipient", {}).get("id")
+    message = event.get("message", {}) or {}
+    message_text = message.get("text", "")
+    attachments = message.get("attachments", [])
+    is_echo = message.get("is_echo", False)
+
+    if not sender_id:
+        return None
+
+    user_id = recipient_id if is_echo else sender_id
+
+    if message_text:
+        msg_type, content, text_for_front = "text", message_text, message_text
+    elif attachments:
+        content = attachments[0]["payload"].get("url", "")
+        msg_type, text_for_front = "file", "📎 Archivo"
+    else:
+        return None
+
+    message_id = message.get("mid")
+    if platform == "instagram" and not message_id:
+        message_id = get_message_hash(user_id, content, event.get("timestamp", 0))
+
+    record = {
+        "platform": platform,
+        "user_id": user_id,
+        "name": None,
+        "message_id": message_id,
+        "is_echo": is_echo,
+        "received_at": datetime.now(BOGOTA_TZ),
+        "msg_type": msg_type,
+        "content": content,
+        "text_for_front": text_for_front,
+        "media": None,
+        "notify": True,
+        "forward": True,
+    }
+
+    if platform == "instagram":
+        record["notify"] = not is_echo
+        record["forward"] = False
+        # 🔒 No enviar a n8n si el mensaje es una respuesta (reply_to) o un share
+        if not is_echo:
+            if message.get("reply_to"):
+                print(f"🚫 Mención o respuesta detectada, no se envía a n8n: {user_id}")
+            elif attachments and any(a.get("type") == "share" for a in attachments):
+                print(f"🚫 Mensaje con attachment tipo 'share' detectado, no se envía a n8n: {user_id}")
+            else:
+                record["forward"] = True
+
+    return record
+
+
+def parse_webhook_payload(body: dict) -> list[dict]:
+    object_type = body.get("object", "")
+    records = []
+    for entry in body.get("entry", []):
+        if "changes" in entry:
+            records.extend(parse_whatsapp_entry(entry))
+
+        if object_type == "page" and "messaging" in entry:
+            events, platform = entry.get("messaging", []), "messenger"
+        elif object_type == "instagram":
+            events, platform = entry.get("messaging", []) or entry.get("standby", []), "instagram"
+        else:
+            continue
+
+        for event in events:
+            record = parse_messaging_event(event, platform)
+            if record:
+                records.append(record)
+    return records
+
+
+async def resolve_sender_names(records: list[dict]):
+    """
+    Completa `name` en paralelo, una consulta por remitente distinto.
+    Instagram usa el username también en los ecos; en Messenger el eco es "system".
+    """
+    resolvers = {"instagram": resolve_instagram_name, "messenger": resolve_messenger_name}
+    for r in records:
+        if r["platform"] == "messenger" and r["is_echo"]:
+            r["name"] = "system"
+
+    keys = list(dict.fromkeys(
+        (r["platform"], r["user_id"]) for r in records if r["name"] is None
+    ))
+    names = await asyncio.gather(*(resolvers[platform](user_id) for platform, user_id in keys))
+    resolved = dict(zip(keys, names))
+    for r in records:
+        if r["name"] is None:
+            r["name"] = resolved[(r["platform"], r["user_id"])] or r["user_id"]
+
+
+# --- Escritura por lotes ---
+def message_document(r: dict) -> dict:
+    """Documento de `messages` para un registro normalizado."""
+    doc = {
+        "_id": r["message_oid"],
+        "conversation_id": r.get("conversation_id"),
+        "sender": "system" if r["is_echo"] else "user",
+        "type": r["msg_type"],
+        "content": r["content"],
+        "timestamp": r["received_at"]
+    }
+    if r["media"]:
+        doc["media_status"] = "pending"
+    doc.update(message_search_fields(doc))
+    return doc
+
+
+async def persist_records(records: list[dict]):
+    """
+    Agrupa los mensajes por conversación y los guarda con un `bulk_write`
+    sobre contacts y un `insert_many` sobre messages. Asigna a cada registro
+    su `conversation_id` y `message_oid`.
+    """
+    groups: OrderedDict[tuple, list[dict]] = OrderedDict()
+    for r in records:
+        groups.setdefault((r["platform"], r["user_id"]), []).append(r)
+        # _id calculado aquí para poder denormalizarlo en `contacts.last_msg`
+        r.setdefault("message_oid", message_oid(r))
+
+    keys = list(groups)
+    operations = []
+    for key in keys:
+        platform, user_id = key
+        group = groups[key]
+        last = group[-1]
+        update = {
+            "$set": {
+                "last_message": last["text_for_front"],
+                "timestamp": last["received_at"],
+                "name": last["name"],
+                **contact_search_fields({"name": last["name"], "user_id": user_id}),
+                "gestionado": False,
+                "bot_active": True,
+                **last_message_fields(message_document(last)),
+            },
+            "$inc": {"unread": sum(0 if r["is_echo"] else 1 for r in group)},
+            # _id generado aquí: si el upsert inserta, ya lo conocemos
+            "$setOnInsert": {"_id": ObjectId()},
+        }
+        if platform == "whatsapp":
+            update.update(recent_messages_push(*[
+                {
+                    "text": r["content"] if r["msg_type"] == "text" else r["text_for_front"],
+                    "timestamp": r["received_at"],
+                    "from": "user",
+                    "type": r["msg_type"]
+                }
+                for r in group
+            ]))
+        operations.append(UpdateOne({"user_id": user_id, "platform": platform}, update, upsert=True))
+
+    try:
+        result = await contacts_collection.bulk_write(operations, ordered=False)
+        upserted_ids = result.upserted_ids
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if not errors or any(err.get("code") != 11000 for err in errors):
+            raise
+        # Otro worker creó el mismo contacto a la vez (índice único): se
+        # reintentan solo esos como update sobre el contacto que ya existe
+        upserted_ids = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+        await contacts_collection.bulk_write([operations[err["index"]] for err in errors], ordered=False)
+    inbox_cache.invalidate()
+
+    resolved: dict[tuple, ObjectId] = {
+        keys[index]: upserted_id for index, upserted_id in upserted_ids.items()
+    }
+    missing = []
+    for key in keys:
+        if key in resolved:
+            continue
+        if key in conversation_ids:
+            resolved[key] = conversation_ids[key]
+        else:
+            missing.append(key)
+
+    if missing:
+        cursor = contacts_collection.find(
+            {"$or": [{"user_id": user_id, "platform": platform} for platform, user_id in missing]},
+            {"_id": 1, "user_id": 1, "platform": 1}
+        )
+        async for doc in cursor:
+            resolved[(doc["platform"], doc["user_id"])] = doc["_id"]
+
+    for key, conversation_id in resolved.items():
+        remember_conversation_id(key, conversation_id)
+
+    for r in records:
+        r["conversation_id"] = str(resolved[(r["platform"], r["user_id"])])
+    documents = []
+    for r in records:
+        doc = message_document(r)
+        if r["platform"] == "instagram":
+            # Eco del webhook + envío desde el dashboard = mismo mensaje
+            doc["dedup_key"] = message_dedup_key(doc)
+        documents.append(doc)
+    await insert_messages(documents)
+
+
+def build_ws_message(r: dict) -> dict:
+    ws_message = {
+        "message_id": str(r["message_oid"]),
+        "user_id": r["user_id"],
+        "conversation_id": r["conversation_id"],
+        "platform": r["platform"],
+        "type": r["msg_type"],
+        "content": r["content"],
+        "timestamp": r["received_at"].isoformat(),
+        "direction": "outbound" if r["is_echo"] else "inbound",
+        "remitente": r["name"]
+    }
+    if r["msg_type"] == "text":
+        ws_message["text"] = r["content"]
+    elif r["media"]:
+        ws_message["media_status"] = "pending"
+    else:
+        ws_message["media_url"] = r["content"]
+    return ws_message
+
+
+def build_n8n_payload(r: dict) -> dict:
+    return {
+        "user_id": r["user_id"],
+        "name": r["name"],
+        "type": r["msg_type"],
+        "content": r["content"],
+        "timestamp": r["received_at"].isoformat(),
+        "bot_active": bool(True)  # ✅ Asegura tipo booleano real
+    }
+
+
+# --- Procesamiento de una entrega del webhook ---
+async def process_webhook_payload(body: dict, event_id: ObjectId | None = None,
+                                  skip_dedup: bool = False) -> int:
+    """
+    Procesa una entrega completa de Meta (WhatsApp, Messenger e Instagram):
+    guarda contactos y mensajes por lotes, notifica al front y reenvía a n8n.
+    `skip_dedup` se usa al reprocesar eventos del log cuya ingestión falló (sus
+    ids ya quedaron registrados en el primer intento); en ese caso solo se
+    procesan los mensajes que no están guardados, así el unread, el WS y n8n
+    no se repiten. Retorna cuántos mensajes se procesaron.
+    """
+    records = parse_webhook_payload(body)
+    if not records:
+        return 0
+
+    if skip_dedup:
+        records = await drop_persisted(records)
+        if not records:
+            return 0
+    else:
+        duplicates = await dedup_store.seen_many([(r["platform"], r["message_id"]) for r in records])
+        for r, duplicate in zip(records, duplicates):
+            if duplicate:
+                print(f"🚫 Mensaje duplicado ignorado: {r['user_id']}: {r['content']}")
+        records = [r for r, duplicate in zip(records, duplicates) if not duplicate]
+        if not records:
+            return 0
+
+    await resolve_sender_names(records)
+    await persist_records(records)
+
+    for r in records:
+        if r["media"]:
+            media_pipeline.submit(run_media_job(event_id, {
+                "message_id": r["message_oid"],
+                "conversation_id": r["conversation_id"],
+                "wa_id": r["user_id"],
+                "profile_name": r["name"],
+                "media_id": r["media"]["media_id"],
+                "mime_type": r["media"]["mime_type"],
+                "msg_type": r["msg_type"],
+                "key": r["media"]["key"],
+                "received_at": r["received_at"],
+            }))
+
+    for r in records:
+        if r["notify"]:
+            await notify_all(build_ws_message(r))
+            print(f"[{PLATFORM_LABELS[r['platform']]}] {r['name']}: {r['content']}")
+
+    # Reenviar a n8n 🚀
+    forwards = [
+        (os.getenv(N8N_URL_ENV[r["platform"]]), build_n8n_payload(r))
+        for r in records if r["forward"]
+    ]
+    if forwards:
+        try:
+            inserted = await enqueue_n8n_many(forwards)
+            print(f"📤 Encolados {len(inserted)} mensajes para n8n")
+        except Exception as e:
+            print("⚠️ Error enviando a n8n:", str(e))
+    return len(records)
+
+
+async def process_logged_event(event: dict, replay: bool = False):
+    """Procesa un evento del log (`{_id, payload}`) y registra su estado."""
+    event_id = event.get("_id")
+    try:
+        processed = await process_webhook_payload(event["payload"], event_id=event_id, skip_dedup=replay)
+    except Exception as e:
+        await webhook_event_log.mark_failed(event_id, "ingest", str(e) or type(e).__name__)
+        raise
+    await webhook_event_log.mark_processed(event_id, processed)
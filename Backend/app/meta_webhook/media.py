@@ -0,0 +1,181 @@
+import asyncio
+import os
+from typing import Awaitable
+
+import boto3
+from dotenv import load_dotenv
+
+from app.core.http_client import get_http_client
+
+load_dotenv()
+
+# --- AWS S3 ---
+AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
+AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
+BUCKET_NAME = "imgbrain"
+REGION = "us-east-1"
+
+s3 = boto3.client(
+    "s3",
+    aws_access_key_id=AWS_ACCESS_KEY,
+    aws_secret_access_key=AWS_SECRET_KEY,
+    region_name=REGION
+)
+
+# --- WhatsApp ---
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_MEDIA_TYPES = {"image", "video", "audio", "document", "sticker"}
+
+# --- Pipeline ---
+MEDIA_MAX_CONCURRENCY = int(os.getenv("MEDIA_MAX_CONCURRENCY", 4))
+# S3 exige partes de al menos 5 MB (excepto la última)
+MEDIA_PART_SIZE = max(int(os.getenv("MEDIA_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", 256 * 1024))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", 120))
+
+
+def s3_public_url(key: str) -> str:
+    return f"https://{BUCKET_NAME}.s3.{REGION}.amazonaws.com/{key}"
+
+
+def media_extension(mime_type: str, filename: str | None = None) -> str:
+    if filename and "." in filename:
+        return filename.rsplit(".", 1)[-1]
+    return mime_type.split("/")[-1].split(";")[0] or "bin"
+
+
+async def get_whatsapp_media_url(media_id: str) -> dict:
+    url = f"https://graph.facebook.com/v20.0/{media_id}"
+    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
+    response = await get_http_client().get(url, headers=headers)
+    return response.json()
+
+
+async def stream_url_to_s3(download_url: str, key: str, content_type: str, headers: dict | None = None) -> str:
+    """
+    Descarga `download_url` por streaming y lo sube a S3 por partes.
+    En memoria solo se mantiene una parte; las llamadas a boto3 (bloqueantes)
+    corren en hilos para no frenar el event loop.
+    """
+    upload_id = None
+    parts = []
+    buffer = bytearray()
+
+    async def flush_part():
+        nonlocal upload_id
+        if upload_id is None:
+            created = await asyncio.to_thread(
+                s3.create_multipart_upload,
+                Bucket=BUCKET_NAME, Key=key, ContentType=content_type,
+            )
+            upload_id = created["UploadId"]
+        part_number = len(parts) + 1
+        body = bytes(buffer)
+        buffer.clear()
+        uploaded = await asyncio.to_thread(
+            s3.upload_part,
+            Bucket=BUCKET_NAME, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        parts.append({"ETag": uploaded["ETag"], "PartNumber": part_number})
+
+    try:
+        async with get_http_client().stream(
+            "GET", download_url, headers=headers, timeout=MEDIA_DOWNLOAD_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(MEDIA_CHUNK_SIZE):
+                buffer.extend(chunk)
+                if len(buffer) >= MEDIA_PART_SIZE:
+                    await flush_part()
+
+        if upload_id is None:
+            # Archivo pequeño: una sola subida
+            await asyncio.to_thread(
+                s3.put_object,
+                Bucket=BUCKET_NAME, Key=key, Body=bytes(buffer), ContentType=content_type,
+            )
+        else:
+            if buffer:
+                await flush_part()
+            await asyncio.to_thread(
+                s3.complete_multipart_upload,
+                Bucket=BUCKET_NAME, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+    except Exception:
+        if upload_id is not None:
+            try:
+                await asyncio.to_thread(
+                    s3.abort_multipart_upload,
+                    Bucket=BUCKET_NAME, Key=key, UploadId=upload_id,
+                )
+            except Exception as e:
+                print("⚠️ Error abortando multipart upload:", str(e))
+        raise
+
+    return s3_public_url(key)
+
+
+async def stream_whatsapp_media_to_s3(media_id: str, key: str, mime_type: str) -> str:
+    media_info = await get_whatsapp_media_url(media_id)
+    download_url = media_info.get("url")
+    if not download_url:
+        raise RuntimeError(f"Graph no devolvió URL para media {media_id}: {media_info}")
+    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
+    return await stream_url_to_s3(download_url, key, mime_type, headers=headers)
+
+
+class MediaPipeline:
+    """
+    Etapa de media fuera del camino crítico: cada trabajo corre como tarea
+    propia con concurrencia acotada, así el webhook y el resto de
+    conversaciones no esperan descargas grandes.
+    """
+
+    def __init__(self, max_concurrency: int = MEDIA_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore: asyncio.Semaphore | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.completed = 0
+        self.failed = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, job: Awaitable):
+        async with self._get_semaphore():
+            try:
+                await job
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print("⚠️ Error en pipeline de media:", str(e))
+
+    def submit(self, job: Awaitable) -> asyncio.Task:
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self, timeout: float = 60):
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"⚠️ {len(pending)} trabajos de media cancelados al apagar")
+
+    def stats(self) -> dict:
+        return {
+            "in_progress": len(self._tasks),
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+media_pipeline = MediaPipeline()
@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Literal, Optional
+
+
+class WebhookReplayRequest(BaseModel):
+    status: Optional[Literal["received", "processed", "failed"]] = Field(
+        "failed", description="Estado de los eventos a reprocesar (None = todos)"
+    )
+    since: Optional[datetime] = Field(None, description="Desde (UTC, incluido)")
+    until: Optional[datetime] = Field(None, description="Hasta (UTC, excluido)")
+    rate: float = Field(10, gt=0, le=200, description="Eventos por segundo")
+    limit: int = Field(1000, gt=0, le=10000, description="Máximo de eventos")
+    force: bool = Field(False, description="Reprocesar también eventos ya procesados (solo los mensajes que no estén guardados)")
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from app.database.mongo import contacts_collection
+from app.meta_webhook.controllers import get_instagram_username, get_messenger_user
+
+load_dotenv()
+
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 6 * 3600))
+PROFILE_CACHE_NEGATIVE_TTL = int(os.getenv("PROFILE_CACHE_NEGATIVE_TTL", 60))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 20000))
+
+# Nombres por defecto que ponen las rutas de envío: no cuentan como nombre real
+PLACEHOLDER_NAMES = {"", "Cliente", "Cliente Instagram", "Desconocido", "system"}
+
+
+class ProfileCache:
+    """
+    Cache TTL + LRU de nombres de remitentes, con single-flight: las consultas
+    concurrentes por la misma clave comparten una sola petición.
+    """
+
+    def __init__(self, ttl: int = PROFILE_CACHE_TTL, max_size: int = PROFILE_CACHE_SIZE,
+                 negative_ttl: int = PROFILE_CACHE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: tuple) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: tuple, value: str, ttl: int | None = None):
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: tuple):
+        self._entries.pop(key, None)
+
+    async def get_or_load(self, key: tuple, loader: Callable[[], Awaitable[tuple[str, bool]]]) -> str:
+        """
+        `loader` retorna (nombre, es_definitivo). Los resultados no definitivos
+        (p. ej. Graph falló) se guardan con un TTL corto.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Cancelaron al que cargaba (no a este): se intenta de nuevo
+                return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value, definitive = await loader()
+            self.set(key, value, None if definitive else self.negative_ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Los que esperaban este resultado no se quedan colgados
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evitar "Future exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+profile_cache = ProfileCache()
+
+
+async def _stored_name(platform: str, user_id: str) -> str | None:
+    contact = await contacts_collection.find_one(
+        {"user_id": user_id, "platform": platform}, {"name": 1}
+    )
+    name = (contact or {}).get("name")
+    if name and name != user_id and name not in PLACEHOLDER_NAMES:
+        return name
+    return None
+
+
+async def resolve_instagram_name(user_id: str) -> str:
+    """Username de Instagram: cache → nombre guardado en el contacto → Graph API."""
+    async def load():
+        stored = await _stored_name("instagram", user_id)
+        if stored:
+            return stored, True
+        try:
+            username = await get_instagram_username(user_id)
+        except Exception as e:
+            print("⚠️ Error consultando username:", str(e))
+            username = None
+        return (username, True) if username else (user_id, False)
+
+    return await profile_cache.get_or_load(("instagram", user_id), load)
+
+
+async def resolve_messenger_name(psid: str) -> str:
+    """Nombre de Messenger: cache → nombre guardado en el contacto → Graph API."""
+    async def load():
+        stored = await _stored_name("messenger", psid)
+        if stored:
+            return stored, True
+        try:
+            user_info = await get_messenger_user(psid)
+        except Exception as e:
+            print("⚠️ Error consultando Messenger user:", str(e))
+            user_info = None
+        name = (
+            f"{user_info.get('first_name', '')} {user_info.get('last_name', '')}".strip()
+            if user_info else ""
+        )
+        return (name, True) if name else (psid, False)
+
+    return await profile_cache.get_or_load(("messenger", psid), load)
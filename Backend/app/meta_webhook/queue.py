@@ -0,0 +1,120 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from app.meta_webhook.ingestion import process_logged_event
+
+load_dotenv()
+
+# --- Configuración del modo "acknowledge-first" ---
+WEBHOOK_ASYNC_MODE = os.getenv("META_WEBHOOK_ASYNC", "false").lower() == "true"
+WEBHOOK_WORKERS = int(os.getenv("META_WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("META_WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("META_WEBHOOK_DRAIN_TIMEOUT", 30))
+
+
+class WebhookQueue:
+    """
+    Cola en memoria para entregas del webhook de Meta.
+    El handler encola el evento ya registrado en el log y responde de
+    inmediato; un pool de workers asyncio lo procesa con concurrencia acotada.
+    Si el proceso cae con eventos en cola, quedan en `received` para replay.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        workers: int = WEBHOOK_WORKERS,
+        maxsize: int = WEBHOOK_QUEUE_SIZE,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._accepting = False
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.started_at: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._accepting = True
+        self.started_at = datetime.utcnow()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"meta-webhook-worker-{i}")
+            for i in range(self.workers)
+        ]
+        print(f"🚀 Cola de webhook iniciada con {self.workers} workers (max {self.maxsize})")
+
+    def enqueue(self, event: dict) -> bool:
+        """Encola sin bloquear. Retorna False si la cola está llena o detenida."""
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _worker(self, worker_id: int):
+        while True:
+            event = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Worker {worker_id} error procesando webhook:", str(e))
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        """Deja de aceptar entregas, drena lo pendiente y cancela los workers."""
+        if not self.running:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Timeout drenando la cola de webhook, {self.depth()} entregas pendientes")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        print("🛑 Cola de webhook detenida")
+
+    def stats(self) -> dict:
+        return {
+            "async_mode": WEBHOOK_ASYNC_MODE,
+            "running": self.running,
+            "workers": self.workers,
+            "queue_depth": self.depth(),
+            "queue_maxsize": self.maxsize,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+        }
+
+
+webhook_queue = WebhookQueue(process_logged_event)
@@ -0,0 +1,145 @@
+"""
+Reprocesamiento de eventos del log del webhook a ritmo controlado.
+
+Uso (exportar el log como corpus para el benchmark):
+    python -m app.meta_webhook.replay export eventos.jsonl [--status processed] [--limit 5000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from app.meta_webhook.event_log import webhook_event_log
+from app.meta_webhook.ingestion import finalize_whatsapp_media, process_logged_event
+
+load_dotenv()
+
+WEBHOOK_REPLAY_RATE = float(os.getenv("WEBHOOK_REPLAY_RATE", 10))
+WEBHOOK_REPLAY_MAX = int(os.getenv("WEBHOOK_REPLAY_MAX", 10000))
+
+
+async def replay_media_jobs(event: dict):
+    """Reintenta solo los trabajos de media que fallaron; el resto ya está guardado."""
+    for job in event.get("media_jobs", []):
+        try:
+            await finalize_whatsapp_media(**job)
+        except Exception as e:
+            print(f"⚠️ Replay de media fallido ({event['_id']}):", str(e))
+            continue
+        await webhook_event_log.media_recovered(event["_id"], job["message_id"])
+
+
+def replay_skips_dedup(event: dict) -> bool:
+    """
+    Solo se salta el dedup si la ingestión falló (o con `force` sobre uno ya
+    procesado); aun así se omiten los mensajes que ya están guardados.
+    Un evento `received` puede seguir en la cola y pasa por el dedup normal.
+    """
+    return (event.get("status") == "failed" and event.get("stage") == "ingest") or \
+        event.get("status") == "processed"
+
+
+class WebhookReplayer:
+    """
+    Reprocesa eventos del log uno a uno, sin superar `rate` eventos por
+    segundo. Solo corre un replay a la vez por proceso.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.progress: dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, status: str | None = "failed", since: datetime | None = None,
+                    until: datetime | None = None, rate: float = WEBHOOK_REPLAY_RATE,
+                    limit: int = WEBHOOK_REPLAY_MAX, force: bool = False) -> dict:
+        if self.running:
+            raise RuntimeError("Ya hay un replay en curso")
+        query = webhook_event_log.build_query(status, since, until)
+        event_ids = await webhook_event_log.find_ids(query, min(limit, WEBHOOK_REPLAY_MAX))
+        self.progress = {
+            "status": status,
+            "since": since.isoformat() if since else None,
+            "until": until.isoformat() if until else None,
+            "rate": rate,
+            "force": force,
+            "matched": len(event_ids),
+            "replayed": 0,
+            "failed": 0,
+            "skipped": 0,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+        }
+        self._task = asyncio.create_task(self._run(event_ids, rate, force), name="webhook-replay")
+        print(f"🔁 Replay de webhook iniciado: {len(event_ids)} eventos a {rate}/s")
+        return self.progress
+
+    async def _run(self, event_ids: list, rate: float, force: bool = False):
+        interval = 1 / rate if rate > 0 else 0
+        try:
+            for event_id in event_ids:
+                started = time.monotonic()
+                event = await webhook_event_log.collection.find_one({"_id": event_id})
+                if event is None:
+                    # Expiró por TTL entre la consulta y el replay
+                    self.progress["skipped"] += 1
+                    continue
+                if event.get("status") == "processed" and not force:
+                    # Ya se ingirió: reprocesarlo duplicaría el trabajo
+                    self.progress["skipped"] += 1
+                    continue
+                try:
+                    if event.get("stage") == "media" and event.get("media_jobs"):
+                        await replay_media_jobs(event)
+                    else:
+                        await process_logged_event(event, replay=replay_skips_dedup(event))
+                    self.progress["replayed"] += 1
+                except Exception as e:
+                    self.progress["failed"] += 1
+                    print(f"⚠️ Replay del evento {event_id} fallido:", str(e))
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+        finally:
+            self.progress["finished_at"] = datetime.utcnow().isoformat()
+            print(f"✅ Replay de webhook terminado: {self.progress}")
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"running": self.running, **self.progress}
+
+
+webhook_replayer = WebhookReplayer()
+
+
+async def export_events(path: str, status: str | None = None, limit: int = WEBHOOK_REPLAY_MAX) -> int:
+    """Escribe los payloads del log en JSONL (formato de `benchmarks.webhook_bench --replay`)."""
+    query = webhook_event_log.build_query(status)
+    cursor = webhook_event_log.collection.find(query, {"payload": 1}).sort("received_at", 1).limit(limit)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        async for doc in cursor:
+            f.write(json.dumps(doc["payload"], ensure_ascii=False, default=str) + "\n")
+            count += 1
+    print(f"📦 {count} eventos exportados a {path}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas del log de eventos del webhook")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="exportar payloads a JSONL")
+    export.add_argument("path")
+    export.add_argument("--status", default=None)
+    export.add_argument("--limit", type=int, default=WEBHOOK_REPLAY_MAX)
+    args = parser.parse_args()
+    asyncio.run(export_events(args.path, args.status, args.limit))
@@ -0,0 +1,209 @@
+import asyncio
+import os
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from app.core.http_client import get_http_client
+from app.database.mongo import n8n_outbox_collection
+
+load_dotenv()
+
+# --- Configuración del outbox de n8n ---
+N8N_OUTBOX_BATCH = int(os.getenv("N8N_OUTBOX_BATCH", 50))
+N8N_MAX_CONCURRENCY_PER_URL = int(os.getenv("N8N_MAX_CONCURRENCY_PER_URL", 4))
+N8N_MAX_ATTEMPTS = int(os.getenv("N8N_MAX_ATTEMPTS", 8))
+N8N_BACKOFF_BASE = float(os.getenv("N8N_BACKOFF_BASE", 2))
+N8N_BACKOFF_MAX = float(os.getenv("N8N_BACKOFF_MAX", 300))
+N8N_POLL_INTERVAL = float(os.getenv("N8N_POLL_INTERVAL", 5))
+N8N_REQUEST_TIMEOUT = float(os.getenv("N8N_REQUEST_TIMEOUT", 5))
+N8N_LEASE_SECONDS = int(os.getenv("N8N_LEASE_SECONDS", 60))
+N8N_DELIVERED_TTL = int(os.getenv("N8N_DELIVERED_TTL", 7 * 24 * 3600))
+
+
+def backoff_delay(attempts: int) -> float:
+    """Backoff exponencial con jitter para el intento número `attempts`."""
+    delay = min(N8N_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), N8N_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class N8nOutbox:
+    """
+    Outbox durable (Mongo) para reenviar eventos a n8n.
+    Los mensajes se guardan como `pending` y un dispatcher los entrega por
+    lotes con el cliente HTTP compartido, reintentos con backoff y un límite
+    de concurrencia por URL.
+    """
+
+    def __init__(self, collection=n8n_outbox_collection):
+        self.collection = collection
+        self.owner = uuid.uuid4().hex
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._semaphores: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(N8N_MAX_CONCURRENCY_PER_URL)
+        )
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def enqueue(self, url: str | None, payload: dict):
+        """Guarda el payload en el outbox y despierta al dispatcher."""
+        inserted = await self.enqueue_many([(url, payload)])
+        return inserted[0] if inserted else None
+
+    async def enqueue_many(self, items: list[tuple[str | None, dict]]):
+        """Guarda varios payloads (url, payload) con un solo insert_many."""
+        now = datetime.utcnow()
+        docs = []
+        for url, payload in items:
+            if not url:
+                print("⚠️ URL de n8n no configurada, payload descartado:", payload)
+                continue
+            docs.append({
+                "url": url,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            })
+        if not docs:
+            return []
+        result = await self.collection.insert_many(docs, ordered=False)
+        self._wake.set()
+        return result.inserted_ids
+
+    async def _claim_batch(self) -> list[dict]:
+        now = datetime.utcnow()
+        candidates = await self.collection.find(
+            {
+                "$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "lease_until": {"$lte": now}},
+                ]
+            },
+            {"_id": 1},
+        ).sort("next_attempt_at", 1).limit(N8N_OUTBOX_BATCH).to_list(length=N8N_OUTBOX_BATCH)
+        if not candidates:
+            return []
+
+        ids = [c["_id"] for c in candidates]
+        # Reclamar de forma atómica: solo nos quedamos con los que ganamos
+        await self.collection.update_many(
+            {
+                "_id": {"$in": ids},
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "sending", "lease_until": {"$lte": now}},
+                ],
+            },
+            {"$set": {
+                "status": "sending",
+                "owner": self.owner,
+                "lease_until": now + timedelta(seconds=N8N_LEASE_SECONDS),
+            }},
+        )
+        return await self.collection.find(
+            {"_id": {"$in": ids}, "status": "sending", "owner": self.owner}
+        ).to_list(length=len(ids))
+
+    async def _deliver(self, doc: dict) -> UpdateOne:
+        async with self._semaphores[doc["url"]]:
+            error = None
+            try:
+                response = await get_http_client().post(
+                    doc["url"],
+                    json=doc["payload"],
+                    headers={"Content-Type": "application/json"},
+                    timeout=N8N_REQUEST_TIMEOUT,
+                )
+                if response.status_code < 400:
+                    self.delivered += 1
+                    return UpdateOne(
+                        {"_id": doc["_id"]},
+                        {"$set": {"status": "delivered", "delivered_at": datetime.utcnow()},
+                         "$unset": {"lease_until": "", "owner": ""}},
+                    )
+                error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+        attempts = doc.get("attempts", 0) + 1
+        if attempts >= N8N_MAX_ATTEMPTS:
+            self.failed += 1
+            print(f"❌ n8n: entrega fallida definitivamente ({doc['url']}): {error}")
+            update = {"status": "failed", "failed_at": datetime.utcnow()}
+        else:
+            self.retried += 1
+            update = {
+                "status": "pending",
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff_delay(attempts)),
+            }
+        update.update({"attempts": attempts, "last_error": error})
+        return UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": update, "$unset": {"lease_until": "", "owner": ""}},
+        )
+
+    async def flush_once(self) -> int:
+        """Entrega un lote. Retorna cuántos documentos se procesaron."""
+        batch = await self._claim_batch()
+        if not batch:
+            return 0
+        updates = await asyncio.gather(*(self._deliver(doc) for doc in batch))
+        await self.collection.bulk_write(list(updates), ordered=False)
+        return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.flush_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("⚠️ Error en dispatcher de n8n:", str(e))
+                processed = 0
+            if processed >= N8N_OUTBOX_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=N8N_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="n8n-outbox")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> dict:
+        pending = await self.collection.count_documents({"status": {"$in": ["pending", "sending"]}})
+        failed = await self.collection.count_documents({"status": "failed"})
+        return {
+            "running": self._task is not None,
+            "pending": pending,
+            "failed": failed,
+            "delivered_by_worker": self.delivered,
+            "retried_by_worker": self.retried,
+        }
+
+
+n8n_outbox = N8nOutbox()
+
+
+async def enqueue_n8n(url: str | None, payload: dict):
+    return await n8n_outbox.enqueue(url, payload)
+
+
+async def enqueue_n8n_many(items: list[tuple[str | None, dict]]):
+    return await n8n_outbox.enqueue_many(items)
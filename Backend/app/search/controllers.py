@@ -0,0 +1,252 @@
+import os
+import re
+import unicodedata
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.database.mongo import contacts_collection, messages_collection
+
+load_dotenv()
+
+# --- Configuración de la búsqueda ---
+SEARCH_MIN_PREFIX = int(os.getenv("SEARCH_MIN_PREFIX", 2))
+SEARCH_MAX_PREFIX = int(os.getenv("SEARCH_MAX_PREFIX", 20))
+SEARCH_MAX_TOKENS = int(os.getenv("SEARCH_MAX_TOKENS", 64))
+# Los mensajes son texto libre: menos palabras y prefijos para no inflar el índice
+SEARCH_MAX_MESSAGE_TOKENS = int(os.getenv("SEARCH_MAX_MESSAGE_TOKENS", 24))
+SEARCH_MAX_MESSAGE_PREFIXES = int(os.getenv("SEARCH_MAX_MESSAGE_PREFIXES", 128))
+# Los números (teléfonos) también se indexan por sufijo: "...4567" encuentra el número
+SEARCH_MIN_SUFFIX = int(os.getenv("SEARCH_MIN_SUFFIX", 4))
+# Candidatos (los más recientes) sobre los que se ordena por relevancia y se facetan
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 1000))
+
+# Campos de texto de un contacto (webhook, envíos y ManyChat)
+CONTACT_SEARCH_FIELDS = (
+    "name", "user_id", "numero", "nombre_cuenta",
+    "info.first_name", "info.last_name", "info.whatsapp_phone",
+)
+# Campos donde se busca con $regex (consultas cortas o subcadenas en medio de palabra)
+CONTACT_REGEX_FIELDS = CONTACT_SEARCH_FIELDS
+FACETS = ("platform", "gestionado", "bot_active")
+# Proyección para no devolver los campos de búsqueda en las respuestas
+SEARCH_FIELDS_EXCLUDED = {"search_tokens": 0, "search_prefixes": 0}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes: "Peñalosa Ángel" → "penalosa angel"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(*texts, max_tokens: int = SEARCH_MAX_TOKENS) -> list[str]:
+    """Tokens normalizados y únicos (en orden), hasta `max_tokens`."""
+    tokens = []
+    for text in texts:
+        if not isinstance(text, str) or not text:
+            continue
+        tokens.extend(_TOKEN_RE.findall(normalize(text)))
+    return list(dict.fromkeys(tokens))[:max_tokens]
+
+
+def token_prefixes(token: str) -> list[str]:
+    if len(token) < SEARCH_MIN_PREFIX:
+        return [token]
+    terms = [token[:n] for n in range(SEARCH_MIN_PREFIX, min(len(token), SEARCH_MAX_PREFIX) + 1)]
+    if token.isdigit():
+        terms.extend(token[-n:] for n in range(SEARCH_MIN_SUFFIX, min(len(token), SEARCH_MAX_PREFIX) + 1))
+    return terms
+
+
+def search_fields(*texts, max_tokens: int = SEARCH_MAX_TOKENS, max_prefixes: int | None = None) -> dict:
+    """
+    Campos de búsqueda a guardar en el documento: `search_tokens` (palabras
+    completas, para el ranking) y `search_prefixes` (prefijos indexados).
+    Con `max_prefixes` solo se indexan las primeras palabras que caben completas.
+    """
+    tokens = tokenize(*texts, max_tokens=max_tokens)
+    prefixes = set()
+    for index, token in enumerate(tokens):
+        added = prefixes.union(token_prefixes(token))
+        if max_prefixes is not None and len(added) > max_prefixes:
+            tokens = tokens[:index]
+            break
+        prefixes = added
+    return {"search_tokens": tokens, "search_prefixes": sorted(prefixes)}
+
+
+def _get_path(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def contact_search_fields(contact: dict) -> dict:
+    return search_fields(*(_get_path(contact, field) for field in CONTACT_SEARCH_FIELDS))
+
+
+def message_search_fields(message: dict) -> dict:
+    """Solo los mensajes de texto se indexan (el contenido de la media es una URL)."""
+    if message.get("type", "text") != "text":
+        return {}
+    return search_fields(
+        message.get("content"),
+        max_tokens=SEARCH_MAX_MESSAGE_TOKENS,
+        max_prefixes=SEARCH_MAX_MESSAGE_PREFIXES,
+    )
+
+
+def query_terms(q: str) -> list[str]:
+    """
+    Términos de la consulta tal como están en `search_prefixes`. Vacío si
+    ninguno alcanza SEARCH_MIN_PREFIX (esas consultas van por $regex).
+    """
+    return [t[:SEARCH_MAX_PREFIX] for t in tokenize(q) if len(t) >= SEARCH_MIN_PREFIX]
+
+
+def regex_filter(q: str, fields) -> dict:
+    """Subcadena literal sin distinguir mayúsculas, como la búsqueda anterior."""
+    pattern = {"$regex": re.escape(q.strip()), "$options": "i"}
+    return {"$or": [{field: pattern} for field in fields]}
+
+
+def text_filter(q: str, regex_fields) -> tuple[dict, list[str]]:
+    """
+    (filtro, términos): prefijos indexados si la consulta tiene términos de
+    al menos SEARCH_MIN_PREFIX caracteres; si no, $regex sobre `regex_fields`.
+    """
+    terms = query_terms(q)
+    if terms:
+        return {"search_prefixes": {"$all": terms}}, terms
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="La búsqueda no tiene términos válidos")
+    return regex_filter(q, regex_fields), []
+
+
+def boolean_filter(value: bool) -> dict | bool:
+    # Los contactos sin el campo cuentan como False
+    return True if value else {"$ne": True}
+
+
+def _score(terms: list[str], tokens_path: str) -> dict:
+    """Palabras de la consulta que coinciden completas (no solo por prefijo)."""
+    return {"$size": {"$setIntersection": [{"$ifNull": [tokens_path, []]}, terms]}}
+
+
+def _facets(prefix: str = "") -> dict:
+    return {
+        # Los contactos de ManyChat guardan el canal en `canal`
+        "platform": [{"$sortByCount": {"$ifNull": [f"${prefix}platform", f"${prefix}canal"]}}],
+        "gestionado": [{"$sortByCount": {"$ifNull": [f"${prefix}gestionado", False]}}],
+        "bot_active": [{"$sortByCount": {"$ifNull": [f"${prefix}bot_active", False]}}],
+    }
+
+
+def _contact_filters(prefix: str, platform, gestionado, bot_active) -> dict:
+    filters = {}
+    if platform:
+        filters["$or"] = [{f"{prefix}platform": platform}, {f"{prefix}canal": platform}]
+    if gestionado is not None:
+        filters[f"{prefix}gestionado"] = boolean_filter(gestionado)
+    if bot_active is not None:
+        filters[f"{prefix}bot_active"] = boolean_filter(bot_active)
+    return filters
+
+
+def contacts_pipeline(match: dict, terms: list[str], skip: int, limit: int,
+                      platform=None, gestionado=None, bot_active=None) -> list[dict]:
+    filters = _contact_filters("", platform, gestionado, bot_active)
+    return [
+        {"$match": {"$and": [match, filters]} if filters else match},
+        # Top-k: el $sort + $limit solo mantiene SEARCH_MAX_CANDIDATES en memoria
+        {"$sort": {"timestamp": -1}},
+        {"$limit": SEARCH_MAX_CANDIDATES},
+        {"$facet": {
+            "hits": [
+                {"$addFields": {"score": _score(terms, "$search_tokens")}},
+                {"$sort": {"score": -1, "timestamp": -1, "_id": -1}},
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": {"user_id": 1, "name": 1, "platform": 1, "gestionado": 1,
+                              "bot_active": 1, "timestamp": 1, "last_msg.content": 1, "score": 1}},
+            ],
+            "total": [{"$count": "count"}],
+            **_facets(),
+        }},
+    ]
+
+
+def messages_pipeline(match: dict, terms: list[str], skip: int, limit: int,
+                      platform=None, gestionado=None, bot_active=None) -> list[dict]:
+    """
+    Mensajes que coinciden (los SEARCH_MAX_CANDIDATES más recientes), cruzados
+    con su contacto para filtrar y facetar por plataforma / gestionado / bot.
+    """
+    pipeline = [
+        {"$match": {**match, "duplicate_of": {"$exists": False}}},
+        {"$sort": {"timestamp": -1}},
+        {"$limit": SEARCH_MAX_CANDIDATES},
+        {"$lookup": {
+            "from": contacts_collection.name,
+            "let": {"contact_id": {"$convert": {
+                "input": "$conversation_id", "to": "objectId", "onError": None, "onNull": None
+            }}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$contact_id"]}}},
+                {"$project": {"user_id": 1, "name": 1, "platform": 1, "canal": 1, "gestionado": 1, "bot_active": 1}},
+            ],
+            "as": "contact",
+        }},
+        {"$unwind": "$contact"},
+    ]
+    filters = _contact_filters("contact.", platform, gestionado, bot_active)
+    if filters:
+        pipeline.append({"$match": filters})
+    pipeline.append(
+        {"$facet": {
+            "hits": [
+                {"$addFields": {"score": _score(terms, "$search_tokens")}},
+                {"$sort": {"score": -1, "timestamp": -1, "_id": -1}},
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": {"conversation_id": 1, "sender": 1, "type": 1, "content": 1,
+                              "timestamp": 1, "contact": 1, "score": 1}},
+            ],
+            "total": [{"$count": "count"}],
+            **_facets("contact."),
+        }}
+    )
+    return pipeline
+
+
+SCOPES = {
+    "contacts": (contacts_pipeline, CONTACT_REGEX_FIELDS),
+    "messages": (messages_pipeline, ("content",)),
+}
+
+
+async def run_search(scope: str, q: str, skip: int, limit: int,
+                     platform=None, gestionado=None, bot_active=None) -> dict:
+    """Ejecuta la búsqueda en una sola agregación y retorna hits, total y facetas."""
+    if scope not in SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope debe ser {' o '.join(SCOPES)}")
+    build, regex_fields = SCOPES[scope]
+    match, terms = text_filter(q, regex_fields)
+    collection = contacts_collection if scope == "contacts" else messages_collection
+    pipeline = build(match, terms, skip, limit, platform, gestionado, bot_active)
+    result = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+    facet = result[0] if result else {}
+    total = facet.get("total", [{}])[0].get("count", 0) if facet.get("total") else 0
+    return {
+        "terms": terms,
+        "total": total,
+        "hits": facet.get("hits", []),
+        "facets": {
+            name: {str(bucket["_id"]).lower(): bucket["count"] for bucket in facet.get(name, [])}
+            for name in FACETS
+        },
+    }
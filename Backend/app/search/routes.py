@@ -0,0 +1,56 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.core.serialization import CONTACT_PLAN, MESSAGE_PLAN, MongoJSONResponse
+from app.search.controllers import run_search
+
+router = APIRouter()
+
+
+def contact_hit(doc: dict) -> dict:
+    hit = CONTACT_PLAN(doc)
+    hit["last_message"] = (hit.pop("last_msg", None) or {}).get("content", "")
+    return hit
+
+
+def message_hit(doc: dict) -> dict:
+    hit = MESSAGE_PLAN(doc)
+    hit["contact"] = CONTACT_PLAN(hit.get("contact") or {})
+    return hit
+
+
+# --- Búsqueda de texto en contactos y mensajes ---
+@router.get("/")
+async def search(
+    q: str = Query(..., min_length=1, description="Texto a buscar (sin importar tildes ni mayúsculas)"),
+    scope: str = Query("contacts", description="contacts | messages"),
+    platform: Optional[str] = Query(None, description="Filtrar por plataforma (whatsapp, instagram, messenger...)"),
+    gestionado: Optional[bool] = Query(None, description="Filtrar por contactos gestionados"),
+    bot_active: Optional[bool] = Query(None, description="Filtrar por bot activo"),
+    limit: int = Query(20, ge=1, le=100, description="Resultados por página"),
+    skip: int = Query(0, ge=0, description="Resultados a omitir (paginación)")
+):
+    """
+    Resultados ordenados por relevancia (palabras completas que coinciden)
+    y luego por fecha, con facetas por plataforma, gestionado y bot_active.
+    """
+    try:
+        result = await run_search(scope, q, skip, limit, platform, gestionado, bot_active)
+        to_hit = contact_hit if scope == "contacts" else message_hit
+        return MongoJSONResponse({
+            "query": q,
+            "scope": scope,
+            "terms": result["terms"],
+            "total": result["total"],
+            "skip": skip,
+            "limit": limit,
+            "has_more": skip + limit < result["total"],
+            "hits": [to_hit(doc) for doc in result["hits"]],
+            "facets": result["facets"],
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
@@ -0,0 +1,454 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import Counter, deque
+
+from dotenv import load_dotenv
+from fastapi import WebSocket
+
+try:
+    import msgpack
+except ImportError:  # MessagePack es opcional: sin la librería se usa JSON
+    msgpack = None
+
+load_dotenv()
+
+# --- Configuración de envío por conexión ---
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))
+# "disconnect": cerrar al cliente lento | "drop": descartar el mensaje nuevo
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "disconnect").lower()
+# Últimos eventos guardados para reconexiones con `last_seq`
+WS_REPLAY_BUFFER = int(os.getenv("WS_REPLAY_BUFFER", 1000))
+# Modo por lotes (opt-in con ?batch_ms=): tope de espera y de eventos por frame
+WS_BATCH_MAX_MS = int(os.getenv("WS_BATCH_MAX_MS", 1000))
+WS_BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", 200))
+ENCODINGS = ("json", "msgpack") if msgpack else ("json",)
+# Heartbeat de aplicación para clientes que responden `pong`
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", 25))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", 75))
+WS_LATENCY_SAMPLES = int(os.getenv("WS_LATENCY_SAMPLES", 2000))
+# Código de cierre para sockets que dejaron de responder
+WS_CLOSE_IDLE = 4408
+
+
+# --- Tópicos ---
+# "*" (todo, comportamiento por defecto), "inbox" (resumen para la lista de
+# conversaciones), "conversation:<id>" y "platform:<whatsapp|messenger|instagram>"
+ALL_TOPIC = "*"
+INBOX_TOPIC = "inbox"
+TOPIC_PREFIXES = ("conversation:", "platform:")
+INBOX_PREVIEW_CHARS = 120
+
+
+def encode_message(message: dict, encoding: str = "json") -> str | bytes:
+    """JSON (mismo formato que `WebSocket.send_json`) o MessagePack binario."""
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def join_frames(frames: list, encoding: str) -> str | bytes:
+    """Une eventos ya serializados en un solo arreglo, sin volver a serializarlos."""
+    if encoding == "msgpack":
+        return msgpack.Packer().pack_array_header(len(frames)) + b"".join(frames)
+    return "[" + ",".join(frames) + "]"
+
+
+def is_valid_topic(topic: str) -> bool:
+    if topic in (ALL_TOPIC, INBOX_TOPIC):
+        return True
+    return any(topic.startswith(prefix) and len(topic) > len(prefix) for prefix in TOPIC_PREFIXES)
+
+
+def message_topics(message: dict) -> list[str]:
+    """Tópicos que reciben el evento completo."""
+    topics = [ALL_TOPIC]
+    if message.get("conversation_id"):
+        topics.append(f"conversation:{message['conversation_id']}")
+    if message.get("platform"):
+        topics.append(f"platform:{message['platform']}")
+    return topics
+
+
+def inbox_summary(message: dict) -> dict:
+    """Versión liviana del evento para quien solo sigue la bandeja."""
+    preview = message.get("text") or message.get("content") or ""
+    if not isinstance(preview, str):
+        preview = ""
+    summary = {
+        key: message[key]
+        for key in ("seq", "event", "type", "user_id", "conversation_id", "platform",
+                    "timestamp", "direction", "remitente", "media_status")
+        if key in message
+    }
+    summary["topic"] = INBOX_TOPIC
+    summary["preview"] = preview[:INBOX_PREVIEW_CHARS]
+    return summary
+
+
+class ClientConnection:
+    """
+    Un socket del dashboard con su cola de salida acotada y su tarea
+    escritora: un cliente lento solo se atrasa a sí mismo. Con `batch_ms`
+    el escritor agrupa lo que llegue en esa ventana en un solo frame arreglo.
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager",
+                 maxsize: int = WS_SEND_QUEUE_SIZE, encoding: str = "json", batch_ms: int = 0):
+        self.websocket = websocket
+        self.manager = manager
+        self.id = uuid.uuid4().hex[:8]
+        self.encoding = encoding if encoding in ENCODINGS else "json"
+        self.batch_ms = max(0, min(batch_ms, WS_BATCH_MAX_MS))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        # True cuando el cliente participa del heartbeat (responde `pong`)
+        self.heartbeat = False
+        self.send_ms_avg = 0.0
+        self.send_ms_max = 0.0
+        self.topics: set[str] = set()
+        # Suscrito a "*" por defecto; la primera suscripción explícita lo reemplaza
+        self.implicit_all = False
+        self._writer: asyncio.Task | None = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop(), name="ws-writer")
+
+    def offer(self, frame: str | bytes) -> bool:
+        """Encola sin esperar. Retorna False si la cola está llena."""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _write_loop(self):
+        reason = "send_error"
+        try:
+            while True:
+                frame = await self.queue.get()
+                count = 1
+                if self.batch_ms:
+                    await asyncio.sleep(self.batch_ms / 1000)
+                    frames = [frame]
+                    while len(frames) < WS_BATCH_MAX_EVENTS and not self.queue.empty():
+                        frames.append(self.queue.get_nowait())
+                    frame, count = join_frames(frames, self.encoding), len(frames)
+                if isinstance(frame, bytes):
+                    send = self.websocket.send_bytes(frame)
+                else:
+                    send = self.websocket.send_text(frame)
+                started = time.perf_counter()
+                await asyncio.wait_for(send, timeout=WS_SEND_TIMEOUT)
+                self._record_send((time.perf_counter() - started) * 1000)
+                self.sent += count
+        except asyncio.CancelledError:
+            return
+        except asyncio.TimeoutError:
+            reason = "send_timeout"
+        except Exception as e:
+            print("⚠️ Error enviando por WebSocket:", str(e))
+        self.manager.disconnect(self, reason)
+
+    def _record_send(self, elapsed_ms: float):
+        # Media móvil exponencial: barata y suficiente para detectar clientes lentos
+        self.send_ms_avg = elapsed_ms if not self.sent else 0.9 * self.send_ms_avg + 0.1 * elapsed_ms
+        self.send_ms_max = max(self.send_ms_max, elapsed_ms)
+        self.manager.send_latencies.append(elapsed_ms)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "topics": sorted(self.topics),
+            "encoding": self.encoding,
+            "batch_ms": self.batch_ms,
+            "heartbeat": self.heartbeat,
+            "queue_depth": self.queue.qsize(),
+            "queue_maxsize": self.queue.maxsize,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "send_ms_avg": round(self.send_ms_avg, 2),
+            "send_ms_max": round(self.send_ms_max, 2),
+            "connected_s": round(now - self.connected_at, 1),
+            "idle_s": round(now - self.last_seen, 1),
+        }
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def close(self, code: int | None = None):
+        """Detiene el escritor y, si se indica `code`, cierra el socket sin esperar."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+
+
+class ConnectionManager:
+    """
+    Conexiones WebSocket vivas de este proceso, con un índice tópico →
+    conexiones para enrutar cada evento solo a quien está suscrito.
+    Cada evento lleva un `seq` creciente dentro de la `epoch` del proceso y
+    queda en un buffer circular para reenviar el delta a quien reconecta.
+    """
+
+    def __init__(self, overflow_policy: str = WS_OVERFLOW_POLICY, replay_size: int = WS_REPLAY_BUFFER):
+        self.connections: set[ClientConnection] = set()
+        self.topic_index: dict[str, set[ClientConnection]] = {}
+        self.overflow_policy = overflow_policy
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.ring: deque[dict] = deque(maxlen=replay_size)
+        self.dropped = 0
+        self.resumed = 0
+        self.resyncs = 0
+        self.disconnects: Counter = Counter()
+        self.send_latencies: deque[float] = deque(maxlen=WS_LATENCY_SAMPLES)
+        self._heartbeat_task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="ws-heartbeat")
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        for connection in list(self.connections):
+            self.disconnect(connection, "server_shutdown", code=1001)
+
+    def touch(self, connection: ClientConnection):
+        connection.last_seen = time.monotonic()
+
+    def reap_idle(self, now: float | None = None) -> int:
+        """Cierra los sockets con heartbeat que no respondieron en `WS_IDLE_TIMEOUT`."""
+        now = now or time.monotonic()
+        reaped = 0
+        for connection in list(self.connections):
+            if connection.heartbeat and now - connection.last_seen > WS_IDLE_TIMEOUT:
+                self.disconnect(connection, "idle_timeout", code=WS_CLOSE_IDLE)
+                reaped += 1
+        return reaped
+
+    async def _heartbeat(self):
+        """
+        Cada `WS_PING_INTERVAL` reapa los sockets sin respuesta y envía un
+        `ping` a los clientes con heartbeat. Los demás dependen de los pings
+        de protocolo de uvicorn (`ws_ping_interval`).
+        """
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            reaped = self.reap_idle()
+            if reaped:
+                print(f"🧹 {reaped} sockets inactivos cerrados")
+            ping = {"event": "ping", "ts": time.time()}
+            for connection in list(self.connections):
+                if connection.heartbeat:
+                    self.send(connection, ping)
+
+    async def connect(self, websocket: WebSocket, topics: list[str] | None = None,
+                      last_seq: int | None = None, epoch: str | None = None,
+                      encoding: str = "json", batch_ms: int = 0,
+                      resume: bool = False) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, self, encoding=encoding, batch_ms=batch_ms)
+        self.connections.add(connection)
+        # Sin tópicos explícitos el cliente recibe todo (compatibilidad)
+        self.subscribe(connection, topics or [ALL_TOPIC])
+        connection.implicit_all = not topics
+        # `hello` / `resync` solo para quien pidió reanudar: los clientes
+        # anteriores tratan cualquier frame como un mensaje de chat
+        resume = resume or last_seq is not None or epoch is not None
+        # Sin awaits desde aquí: el delta queda en cola antes que cualquier evento nuevo
+        if resume:
+            self.send(connection, {
+                "event": "hello",
+                "epoch": self.epoch,
+                "seq": self.seq,
+                "encoding": connection.encoding,
+                "batch_ms": connection.batch_ms,
+            })
+        if last_seq is not None:
+            self.resume(connection, last_seq, epoch)
+        connection.start()
+        return connection
+
+    def resume(self, connection: ClientConnection, last_seq: int, epoch: str | None):
+        """
+        Encola los eventos posteriores a `last_seq`. Si la epoch cambió
+        (reinicio u otro worker) o el hueco ya salió del buffer, pide al
+        cliente un refresco completo con un evento `resync`.
+        """
+        oldest = self.ring[0]["seq"] if self.ring else self.seq + 1
+        reason = None
+        if epoch != self.epoch:
+            reason = "epoch_changed"
+        elif last_seq > self.seq:
+            reason = "ahead_of_server"
+        elif last_seq < oldest - 1:
+            reason = "gap_too_large"
+
+        if reason is None:
+            frames = []
+            for message in self.ring:
+                if message["seq"] <= last_seq:
+                    continue
+                frame = self.frame_for(connection, message)
+                if frame is not None:
+                    frames.append(frame)
+            if len(frames) >= connection.queue.maxsize:
+                reason = "gap_too_large"
+            else:
+                for frame in frames:
+                    connection.offer(frame)
+                self.resumed += 1
+                return
+
+        self.resyncs += 1
+        self.send(connection, {"event": "resync", "reason": reason, "epoch": self.epoch, "seq": self.seq})
+
+    def frame_for(self, connection: ClientConnection, message: dict) -> str | bytes | None:
+        """Frame que le corresponde a una conexión según sus tópicos (o None)."""
+        if connection.topics.intersection(message_topics(message)):
+            return encode_message(message, connection.encoding)
+        if INBOX_TOPIC in connection.topics:
+            return encode_message(inbox_summary(message), connection.encoding)
+        return None
+
+    def disconnect(self, connection: ClientConnection, reason: str, code: int | None = None):
+        if connection not in self.connections:
+            return
+        self.connections.discard(connection)
+        self.unsubscribe(connection, list(connection.topics))
+        self.disconnects[reason] += 1
+        connection.close(code)
+
+    def subscribe(self, connection: ClientConnection, topics: list[str]) -> list[str]:
+        accepted = [t for t in topics if is_valid_topic(t)]
+        if connection.implicit_all and accepted:
+            connection.implicit_all = False
+            self.unsubscribe(connection, [ALL_TOPIC])
+        for topic in accepted:
+            connection.topics.add(topic)
+            self.topic_index.setdefault(topic, set()).add(connection)
+        return accepted
+
+    def unsubscribe(self, connection: ClientConnection, topics: list[str]):
+        for topic in topics:
+            connection.topics.discard(topic)
+            subscribers = self.topic_index.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.topic_index[topic]
+
+    def set_topics(self, connection: ClientConnection, topics: list[str]) -> list[str]:
+        """Reemplaza las suscripciones de la conexión."""
+        self.unsubscribe(connection, list(connection.topics))
+        return self.subscribe(connection, topics)
+
+    def send(self, connection: ClientConnection, message: dict):
+        """Respuesta directa a una conexión (acks del protocolo)."""
+        if not connection.offer(encode_message(message, connection.encoding)):
+            self._overflow(connection)
+
+    def _overflow(self, connection: ClientConnection):
+        self.dropped += 1
+        if self.overflow_policy == "disconnect":
+            print("⚠️ Cliente WebSocket lento desconectado (cola llena)")
+            # 1013: "try again later"
+            self.disconnect(connection, "overflow", code=1013)
+
+    def _deliver(self, recipients: set[ClientConnection], message: dict) -> int:
+        """Serializa una vez por codificación y encola en cada destinatario."""
+        frames: dict[str, str | bytes] = {}
+        delivered = 0
+        for connection in recipients:
+            frame = frames.get(connection.encoding)
+            if frame is None:
+                frame = frames[connection.encoding] = encode_message(message, connection.encoding)
+            if connection.offer(frame):
+                delivered += 1
+            else:
+                self._overflow(connection)
+        return delivered
+
+    def broadcast(self, message: dict) -> int:
+        """
+        Encola el evento solo en las conexiones suscritas, sin esperar envíos:
+        el evento completo a `*`, `conversation:<id>` y `platform:<p>`, y un
+        resumen a quien solo sigue `inbox`. Retorna a cuántas conexiones llegó.
+        """
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.ring.append(message)
+
+        full: set[ClientConnection] = set()
+        for topic in message_topics(message):
+            full |= self.topic_index.get(topic, set())
+        inbox_only = self.topic_index.get(INBOX_TOPIC, set()) - full
+
+        delivered = 0
+        if full:
+            delivered += self._deliver(full, message)
+        if inbox_only:
+            delivered += self._deliver(inbox_only, inbox_summary(message))
+        return delivered
+
+    def latency_summary(self) -> dict:
+        samples = sorted(self.send_latencies)
+        if not samples:
+            return {"samples": 0}
+
+        def pick(pct: float) -> float:
+            return round(samples[min(len(samples) - 1, int(pct / 100 * len(samples)))], 2)
+
+        return {"samples": len(samples), "p50": pick(50), "p95": pick(95), "p99": pick(99), "max": round(samples[-1], 2)}
+
+    def metrics(self) -> dict:
+        """Estado detallado: resumen, latencia de envío y métricas por conexión."""
+        connections = [c.metrics() for c in self.connections]
+        return {
+            **self.stats(),
+            "queue_depth_total": sum(c["queue_depth"] for c in connections),
+            "send_latency_ms": self.latency_summary(),
+            "connections_detail": sorted(connections, key=lambda c: -c["queue_depth"]),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "overflow_policy": self.overflow_policy,
+            "queue_maxsize": WS_SEND_QUEUE_SIZE,
+            "dropped": self.dropped,
+            "disconnects": dict(self.disconnects),
+            "topics": {topic: len(conns) for topic, conns in self.topic_index.items()},
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "replay_buffer": len(self.ring),
+            "resumed": self.resumed,
+            "resyncs": self.resyncs,
+            "encodings": dict(Counter(c.encoding for c in self.connections)),
+            "batched": sum(1 for c in self.connections if c.batch_ms),
+        }
+
+
+manager = ConnectionManager()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from app.database.mongo import ws_events_collection
+from app.websocket.connections import manager
+
+load_dotenv()
+
+# --- Configuración del fanout entre workers ---
+# "local": un solo proceso | "mongo": change stream sobre `ws_events`
+WS_FANOUT_BACKEND = os.getenv("WS_FANOUT_BACKEND", "local").lower()
+WS_FANOUT_BATCH = int(os.getenv("WS_FANOUT_BATCH", 100))
+WS_FANOUT_QUEUE_SIZE = int(os.getenv("WS_FANOUT_QUEUE_SIZE", 10000))
+WS_FANOUT_TTL = int(os.getenv("WS_FANOUT_TTL", 3600))
+WS_FANOUT_RETRY_DELAY = float(os.getenv("WS_FANOUT_RETRY_DELAY", 2))
+
+
+class LocalFanout:
+    """Entrega directa a los sockets de este proceso (un solo worker)."""
+
+    name = "local"
+
+    def __init__(self, deliver=manager.broadcast):
+        self.deliver = deliver
+        self.published = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, message: dict):
+        self.published += 1
+        self.deliver(message)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published}
+
+
+class MongoFanout(LocalFanout):
+    """
+    Fanout entre workers de uvicorn vía Mongo.
+    Cada evento se entrega de inmediato a los sockets locales y se publica
+    por lotes en `ws_events`; cada worker sigue la colección con un change
+    stream y reenvía a sus sockets los eventos de otros workers.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection=ws_events_collection, deliver=manager.broadcast):
+        super().__init__(deliver)
+        self.collection = collection
+        self.origin = uuid.uuid4().hex
+        self._outbox: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._resume_token = None
+        self.relayed = 0
+        self.publish_dropped = 0
+        self.errors = 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._outbox = asyncio.Queue(maxsize=WS_FANOUT_QUEUE_SIZE)
+        self._tasks = [
+            asyncio.create_task(self._publisher(), name="ws-fanout-publisher"),
+            asyncio.create_task(self._relay(), name="ws-fanout-relay"),
+        ]
+        print(f"📡 Fanout de WebSocket por Mongo iniciado (worker {self.origin[:8]})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def publish(self, message: dict):
+        super().publish(message)
+        if self._outbox is None:
+            return
+        try:
+            self._outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.publish_dropped += 1
+
+    async def _publisher(self):
+        """Agrupa lo publicado en un solo `insert_many` por vuelta."""
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < WS_FANOUT_BATCH and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            now = datetime.utcnow()
+            try:
+                await self.collection.insert_many(
+                    [{"origin": self.origin, "message": m, "created_at": now} for m in batch],
+                    ordered=False,
+                )
+            except Exception as e:
+                self.errors += 1
+                self.publish_dropped += len(batch)
+                print("⚠️ Error publicando eventos de WebSocket:", str(e))
+
+    async def _relay(self):
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "fullDocument.origin": {"$ne": self.origin},
+        }}]
+        while True:
+            try:
+                async with self.collection.watch(pipeline, resume_after=self._resume_token) as stream:
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self.relayed += 1
+                        self.deliver(change["fullDocument"]["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                if getattr(e, "code", None) == 286:
+                    # El resume token salió del oplog: seguir desde ahora
+                    self._resume_token = None
+                print("⚠️ Change stream de WebSocket interrumpido, reintentando:", str(e))
+                await asyncio.sleep(WS_FANOUT_RETRY_DELAY)
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "origin": self.origin,
+            "relayed": self.relayed,
+            "pending_publish": self._outbox.qsize() if self._outbox else 0,
+            "publish_dropped": self.publish_dropped,
+            "errors": self.errors,
+        }
+
+
+FANOUT_BACKENDS = {"local": LocalFanout, "mongo": MongoFanout}
+
+if WS_FANOUT_BACKEND not in FANOUT_BACKENDS:
+    raise RuntimeError(f"WS_FANOUT_BACKEND inválido: {WS_FANOUT_BACKEND}")
+
+fanout = FANOUT_BACKENDS[WS_FANOUT_BACKEND]()
@@ -1,24 +1,100 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
+from app.auth.jwt.jwt import get_current_user
+from app.websocket.connections import manager
+from app.websocket.fanout import fanout
+import json
 
 router = APIRouter()
 
-active_connections = []
+
+def handle_client_message(connection, raw: str):
+    """
+    Protocolo sobre el mismo socket:
+    {"action": "subscribe" | "unsubscribe" | "set", "topics": ["inbox", "conversation:<id>", "platform:whatsapp"]}
+    {"action": "pong"} en respuesta al `ping` del servidor, {"action": "ping"} → `pong`
+    """
+    manager.touch(connection)
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return
+    if not isinstance(data, dict):
+        return
+
+    action = data.get("action")
+    if action == "pong":
+        connection.heartbeat = True
+        return
+    if action == "ping":
+        manager.send(connection, {"event": "pong", "ts": data.get("ts")})
+        return
+
+    topics = data.get("topics") or []
+    if isinstance(topics, str):
+        topics = [topics]
+    topics = [t for t in topics if isinstance(t, str)]
+
+    if action == "subscribe":
+        accepted = manager.subscribe(connection, topics)
+    elif action == "unsubscribe":
+        manager.unsubscribe(connection, topics)
+        accepted = []
+    elif action == "set":
+        accepted = manager.set_topics(connection, topics)
+    else:
+        return
+
+    manager.send(connection, {
+        "event": "subscriptions",
+        "accepted": accepted,
+        "rejected": [t for t in topics if t not in accepted and action != "unsubscribe"],
+        "topics": sorted(connection.topics),
+    })
+
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    active_connections.append(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    topics: str = Query(None, description="Tópicos separados por coma (por defecto todos)"),
+    last_seq: int = Query(None, description="Último seq recibido antes de reconectar"),
+    epoch: str = Query(None, description="Epoch del servidor que emitió last_seq"),
+    resume: bool = Query(False, description="Recibir `hello` (epoch y seq) para poder reanudar con last_seq"),
+    encoding: str = Query("json", description="json | msgpack (frames binarios)"),
+    batch_ms: int = Query(0, description="Agrupar eventos en un arreglo cada N ms (0 = desactivado)"),
+    heartbeat: bool = Query(False, description="Recibir `ping` y ser desconectado si no responde")
+):
+    initial_topics = [t.strip() for t in topics.split(",") if t.strip()] if topics else None
+    connection = await manager.connect(
+        websocket, initial_topics, last_seq=last_seq, epoch=epoch,
+        encoding=encoding, batch_ms=batch_ms, resume=resume
+    )
+    connection.heartbeat = heartbeat
+    reason = "client_closed"
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
+            handle_client_message(connection, await websocket.receive_text())
+    except WebSocketDisconnect as e:
+        if e.code not in (1000, 1001, 1005):
+            reason = f"closed_{e.code}"
+    except Exception:
+        reason = "receive_error"
+    finally:
+        manager.disconnect(connection, reason)
+
 
 async def notify_all(message: dict):
-    for connection in active_connections[:]:
-        try:
-            await connection.send_json(message)
-        except:
-            active_connections.remove(connection)
+    """
+    Encola el mensaje para los dashboards suscritos de este worker y lo
+    publica para los demás workers; no espera los envíos.
+    """
+    fanout.publish(message)
+
+
+@router.get("/ws/stats")
+async def websocket_stats(current_user: dict = Depends(get_current_user(["admin"]))):
+    return {**manager.stats(), "fanout": fanout.stats()}
 
 
+@router.get("/ws/metrics")
+async def websocket_metrics(current_user: dict = Depends(get_current_user(["admin"]))):
+    return {**manager.metrics(), "fanout": fanout.stats()}
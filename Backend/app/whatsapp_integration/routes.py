@@ -1,6 +1,5 @@
 import os
 import httpx
-import pytz
 from bson import ObjectId
 from datetime import datetime, timezone
 from typing import Optional
@@ -12,8 +11,14 @@ import requests
 from app.whatsapp_integration.controllers import send_whatsapp_message
 # Colecciones Mongo
 from app.database.mongo import contacts_collection, messages_collection
+from app.conversations.cache import inbox_cache
+from app.conversations.controllers import last_message_fields
+from app.search.controllers import contact_search_fields, message_search_fields
+from app.core.serialization import to_bogota
 # WebSocket notify
 from app.websocket.routes import notify_all
+# Outbox de n8n
+from app.n8n.outbox import enqueue_n8n
 
 router = APIRouter()
 
@@ -42,29 +47,6 @@ def upload_to_s3(file_bytes: bytes, filename: str, content_type: str) -> str:
     )
     return f"https://{BUCKET_NAME}.s3.{REGION}.amazonaws.com/{filename}"
 
-# --- Utilidad para limpiar documentos de Mongo ---
-def clean_mongo_doc(doc: dict) -> dict:
-    """Convierte ObjectId y datetime en tipos serializables (str) y ajusta hora a Bogotá."""
-    clean = {}
-    bogota_tz = pytz.timezone("America/Bogota")
-
-    for k, v in doc.items():
-        if isinstance(v, ObjectId):
-            clean[k] = str(v)
-        elif isinstance(v, datetime):
-            if v.tzinfo is not None:
-                bogota_time = v.astimezone(bogota_tz)
-            else:
-                utc_time = v.replace(tzinfo=pytz.UTC)
-                bogota_time = utc_time.astimezone(bogota_tz)
-
-            clean[k] = bogota_time.isoformat()
-            clean[f"{k}_pretty"] = bogota_time.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            clean[k] = v
-    return clean
-
-
 @router.post("/whatsapp/send-message")
 async def send_message(
     wa_id: str = Form(...),
@@ -191,31 +173,36 @@ async def send_message(
         # =============================
         # 💬 CONTACTO Y CONVERSACIÓN
         # =============================
-        existing_conv = await contacts_collection.find_one({"user_id": wa_id, "platform": "whatsapp"})
+        existing_conv = await contacts_collection.find_one({"user_id": wa_id, "platform": "whatsapp"}, {"name": 1})
         nombre_contacto = existing_conv.get("name", "Cliente") if existing_conv else "Cliente"
 
+        new_message = {
+            "_id": ObjectId(),
+            "sender": "system",
+            "name": nombre_contacto,
+            "type": msg_type,
+            "content": content,
+            "timestamp": utc_now
+        }
+
         conv = await contacts_collection.find_one_and_update(
             {"user_id": wa_id, "platform": "whatsapp"},
             {
                 "$set": {
                     "last_message": last_message,
                     "timestamp": utc_now,
-                    "name": nombre_contacto
+                    "name": nombre_contacto,
+                    **contact_search_fields({"name": nombre_contacto, "user_id": wa_id}),
+                    **last_message_fields(new_message)
                 }
             },
+            projection={"_id": 1},
             upsert=True,
             return_document=True
         )
 
-        new_message = {
-            "conversation_id": str(conv["_id"]),
-            "sender": "system",
-            "name": nombre_contacto,
-            "type": msg_type,
-            "content": content,
-            "timestamp": utc_now
-        }
-        await messages_collection.insert_one(new_message)
+        new_message["conversation_id"] = str(conv["_id"])
+        await messages_collection.insert_one({**new_message, **message_search_fields(new_message)})
 
         # =============================
         # 🧠 DESACTIVAR BOT Y AVISAR A N8N
@@ -224,6 +211,7 @@ async def send_message(
             {"user_id": wa_id, "platform": "whatsapp"},
             {"$set": {"bot_active": False}}
         )
+        inbox_cache.invalidate()
 
         n8n_url = os.getenv("N8N_WEBHOOK_URL_BOT_ACTIVE")  # 📡 webhook de n8n
         if n8n_url:
@@ -235,20 +223,19 @@ async def send_message(
                 "timestamp": utc_now.isoformat()
             }
             try:
-                async with httpx.AsyncClient() as client:
-                    await client.post(n8n_url, json=payload)
+                await enqueue_n8n(n8n_url, payload)
             except Exception as err:
-                print(f"⚠️ Error enviando estado a N8N: {err}")
+                print(f"⚠️ Error encolando estado para N8N: {err}")
 
         # =============================
         # 🔔 NOTIFICAR POR WEBSOCKET
         # =============================
-        bogota_tz = pytz.timezone("America/Bogota")
-        bogota_time = utc_now.astimezone(bogota_tz)
+        bogota_time = to_bogota(utc_now)
 
         notification_message = {
             "type": "new_message",
             "user_id": wa_id,
+            "conversation_id": str(conv["_id"]),
             "platform": "whatsapp",
             "text": last_message,
             "timestamp": bogota_time.isoformat(),
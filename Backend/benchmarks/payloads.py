@@ -0,0 +1,152 @@
+"""
+Generadores de entregas del webhook de Meta (WhatsApp, Messenger, Instagram)
+con la forma que envía Graph API: texto, adjuntos, ecos y reenvíos duplicados.
+"""
+import json
+import random
+import time
+import uuid
+
+WHATSAPP_MEDIA = [
+    ("image", "image/jpeg", None),
+    ("audio", "audio/ogg; codecs=opus", None),
+    ("document", "application/pdf", "factura.pdf"),
+]
+PAGE_ID = "100000000000001"
+IG_ACCOUNT_ID = "17840000000000001"
+
+
+def _mid() -> str:
+    return f"m_{uuid.uuid4().hex}"
+
+
+def whatsapp_message(rng: random.Random, wa_id: str, media_ratio: float) -> dict:
+    msg = {"from": wa_id, "id": f"wamid.{uuid.uuid4().hex}", "timestamp": str(int(time.time()))}
+    if rng.random() < media_ratio:
+        msg_type, mime_type, filename = rng.choice(WHATSAPP_MEDIA)
+        media = {"id": uuid.uuid4().hex[:16], "mime_type": mime_type}
+        if filename:
+            media["filename"] = filename
+        msg.update(type=msg_type, **{msg_type: media})
+    else:
+        msg.update(type="text", text={"body": f"Hola, quiero información #{rng.randint(1, 9999)}"})
+    return msg
+
+
+def whatsapp_delivery(rng: random.Random, users: list[str], size: int, media_ratio: float) -> dict:
+    wa_id = rng.choice(users)
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "WABA_ID",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"wa_id": wa_id, "profile": {"name": f"Cliente {wa_id[-4:]}"}}],
+                    "messages": [whatsapp_message(rng, wa_id, media_ratio) for _ in range(size)],
+                },
+            }],
+        }],
+    }
+
+
+def messaging_event(rng: random.Random, platform: str, user_id: str, echo_ratio: float, media_ratio: float) -> dict:
+    own_id = PAGE_ID if platform == "messenger" else IG_ACCOUNT_ID
+    is_echo = rng.random() < echo_ratio
+    message = {"mid": _mid()}
+    roll = rng.random()
+    if roll < media_ratio:
+        kind = "share" if platform == "instagram" and rng.random() < 0.3 else "image"
+        message["attachments"] = [{"type": kind, "payload": {"url": f"https://cdn.local/{uuid.uuid4().hex}.jpg"}}]
+    else:
+        message["text"] = f"¿Tienen disponibilidad? #{rng.randint(1, 9999)}"
+        if platform == "instagram" and rng.random() < 0.1:
+            message["reply_to"] = {"story": {"id": uuid.uuid4().hex[:12]}}
+    if is_echo:
+        message["is_echo"] = True
+    return {
+        "sender": {"id": own_id if is_echo else user_id},
+        "recipient": {"id": user_id if is_echo else own_id},
+        "timestamp": int(time.time() * 1000),
+        "message": message,
+    }
+
+
+def messaging_delivery(rng: random.Random, platform: str, users: list[str], size: int,
+                       echo_ratio: float, media_ratio: float) -> dict:
+    user_id = rng.choice(users)
+    return {
+        "object": "page" if platform == "messenger" else "instagram",
+        "entry": [{
+            "id": PAGE_ID if platform == "messenger" else IG_ACCOUNT_ID,
+            "time": int(time.time() * 1000),
+            "messaging": [
+                messaging_event(rng, platform, user_id, echo_ratio, media_ratio) for _ in range(size)
+            ],
+        }],
+    }
+
+
+def generate_deliveries(
+    count: int,
+    *,
+    users: int = 200,
+    batch_size: int = 1,
+    duplicate_ratio: float = 0.05,
+    echo_ratio: float = 0.1,
+    media_ratio: float = 0.1,
+    mix: dict[str, float] | None = None,
+    seed: int = 7,
+) -> list[dict]:
+    """
+    Genera `count` entregas. `mix` reparte plataformas (por defecto 60/25/15
+    WhatsApp/Messenger/Instagram) y `duplicate_ratio` reenvía entregas ya
+    generadas, como hace Meta cuando no recibe el 200 a tiempo.
+    """
+    rng = random.Random(seed)
+    mix = mix or {"whatsapp": 0.6, "messenger": 0.25, "instagram": 0.15}
+    platforms, weights = zip(*mix.items())
+    senders = {
+        "whatsapp": [f"57300{i:07d}" for i in range(users)],
+        "messenger": [f"{24000000000000 + i}" for i in range(users)],
+        "instagram": [f"{17841000000000 + i}" for i in range(users)],
+    }
+
+    deliveries = []
+    for _ in range(count):
+        if deliveries and rng.random() < duplicate_ratio:
+            deliveries.append(rng.choice(deliveries))
+            continue
+        platform = rng.choices(platforms, weights)[0]
+        if platform == "whatsapp":
+            deliveries.append(whatsapp_delivery(rng, senders[platform], batch_size, media_ratio))
+        else:
+            deliveries.append(messaging_delivery(rng, platform, senders[platform], batch_size,
+                                                 echo_ratio, media_ratio))
+    return deliveries
+
+
+def load_deliveries(path: str) -> list[dict]:
+    """
+    Lee entregas reales desde un archivo JSONL: una por línea, ya sea el body
+    crudo del webhook o un documento con el body en `payload`.
+    """
+    deliveries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line)
+            deliveries.append(doc["payload"] if "payload" in doc and "entry" not in doc else doc)
+    return deliveries
+
+
+def count_messages(body: dict) -> int:
+    total = 0
+    for entry in body.get("entry", []):
+        for change in entry.get("changes", []):
+            total += len(change.get("value", {}).get("messages", []))
+        total += len(entry.get("messaging", []) or entry.get("standby", []))
+    return total
@@ -0,0 +1,137 @@
+"""
+Micro-benchmark de serialización del historial de mensajes.
+
+Compara, sobre N documentos de `messages` como los devuelve Motor, la ruta
+anterior (clean_mongo_doc copiado en cada router, con pytz.timezone por
+documento y strftime por fecha, luego jsonable_encoder + json.dumps de
+FastAPI) con la actual (plan de la colección + MongoJSONResponse/orjson).
+
+Uso (desde Backend/):
+    python -m benchmarks.serialization_bench
+    python -m benchmarks.serialization_bench --messages 10000 --rounds 20 --json
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.serialization import MESSAGE_PLAN, MongoJSONResponse
+
+
+def legacy_clean_mongo_doc(doc: dict) -> dict:
+    """Versión previa (copiada en conversations, whatsapp y facebook)."""
+    clean = {}
+    bogota_tz = pytz.timezone("America/Bogota")
+
+    for k, v in doc.items():
+        if isinstance(v, ObjectId):
+            clean[k] = str(v)
+        elif isinstance(v, datetime):
+            if v.tzinfo is not None:
+                bogota_time = v.astimezone(bogota_tz)
+            else:
+                utc_time = v.replace(tzinfo=pytz.UTC)
+                bogota_time = utc_time.astimezone(bogota_tz)
+
+            clean[k] = bogota_time.isoformat()
+            clean[f"{k}_pretty"] = bogota_time.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            clean[k] = v
+    return clean
+
+
+def message_item(m: dict) -> dict:
+    return {
+        "sender": m.get("sender", ""),
+        "content": m.get("content", ""),
+        "timestamp": m.get("timestamp"),
+        "pretty_time": m.get("timestamp_pretty", "")
+    }
+
+
+def generate_messages(count: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    conversation_id = str(ObjectId())
+    start = datetime(2024, 1, 1)
+    words = ["hola", "pedido", "envío", "gracias", "rizos", "precio", "😊", "crema", "gel"]
+    return [
+        {
+            "_id": ObjectId(),
+            "conversation_id": conversation_id,
+            "sender": rng.choice(["user", "system"]),
+            "type": "text",
+            "content": " ".join(rng.choice(words) for _ in range(rng.randint(3, 25))),
+            "timestamp": start + timedelta(seconds=i * 37),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_body(docs: list[dict]) -> bytes:
+    messages = [message_item(legacy_clean_mongo_doc(m)) for m in docs]
+    return JSONResponse(jsonable_encoder({"messages": messages})).body
+
+
+def current_body(docs: list[dict]) -> bytes:
+    messages = [message_item(MESSAGE_PLAN(m)) for m in docs]
+    return MongoJSONResponse({"messages": messages}).body
+
+
+def measure(fn, docs: list[dict], rounds: int) -> dict:
+    fn(docs)  # calentamiento
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = fn(docs)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "bytes": len(body),
+    }
+
+
+def run(args) -> dict:
+    docs = generate_messages(args.messages, args.seed)
+    legacy = json.loads(legacy_body(docs[:50]))
+    current = json.loads(current_body(docs[:50]))
+    if legacy != current:
+        raise SystemExit("❌ Las dos rutas producen respuestas distintas")
+
+    before = measure(legacy_body, docs, args.rounds)
+    after = measure(current_body, docs, args.rounds)
+    return {
+        "messages": args.messages,
+        "rounds": args.rounds,
+        "legacy": before,
+        "current": after,
+        "speedup": round(before["median_ms"] / after["median_ms"], 2) if after["median_ms"] else 0,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark de serialización de mensajes")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"🏁 {report['messages']} mensajes, {report['rounds']} rondas (mediana)")
+        print(f"   Antes:   {report['legacy']['median_ms']} ms ({report['legacy']['bytes']} bytes)")
+        print(f"   Ahora:   {report['current']['median_ms']} ms ({report['current']['bytes']} bytes)")
+        print(f"   Mejora:  x{report['speedup']}")
@@ -0,0 +1,416 @@
+"""
+Stand-ins locales para el benchmark del webhook: MongoDB en memoria con
+conteo de operaciones, Graph API / n8n vía httpx.MockTransport y un S3 falso.
+Solo implementan lo que usa el camino de ingestión.
+"""
+import asyncio
+import copy
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import httpx
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+# --- MongoDB en memoria ---
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        elif isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+_MISSING = object()
+
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == "$in":
+                if value is _MISSING or not (value in arg or (isinstance(value, list) and set(value) & set(arg))):
+                    return False
+            elif op == "$nin":
+                if value is not _MISSING and value in arg:
+                    return False
+            elif op == "$ne":
+                if value == arg:
+                    return False
+            elif op in ("$lt", "$lte", "$gt", "$gte"):
+                if value is _MISSING or value is None:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+            elif op == "$size":
+                if not isinstance(value, list) or len(value) != arg:
+                    return False
+            elif op == "$all":
+                if not isinstance(value, list) or not all(a in value for a in arg):
+                    return False
+            else:
+                raise NotImplementedError(f"Operador no soportado en el stand-in: {op}")
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    if value is _MISSING:
+        return condition is None
+    return value == condition
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif not _match_value(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        if op == "$set":
+            for k, v in fields.items():
+                _set_path(doc, k, copy.deepcopy(v))
+        elif op == "$setOnInsert":
+            if inserting:
+                for k, v in fields.items():
+                    _set_path(doc, k, copy.deepcopy(v))
+        elif op == "$inc":
+            for k, v in fields.items():
+                current = _get_path(doc, k)
+                _set_path(doc, k, (0 if current is _MISSING else current) + v)
+        elif op == "$unset":
+            for k in fields:
+                doc.pop(k, None)
+        elif op == "$push":
+            for k, v in fields.items():
+                current = doc.setdefault(k, [])
+                if isinstance(v, dict) and "$each" in v:
+                    current.extend(copy.deepcopy(v["$each"]))
+                    if "$slice" in v:
+                        limit = v["$slice"]
+                        doc[k] = current[limit:] if limit < 0 else current[:limit]
+                else:
+                    current.append(copy.deepcopy(v))
+        elif op == "$pull":
+            for k, v in fields.items():
+                current = doc.get(k)
+                if isinstance(current, list):
+                    doc[k] = [
+                        item for item in current
+                        if not (matches(item, v) if isinstance(v, dict) and isinstance(item, dict) else item == v)
+                    ]
+        else:
+            raise NotImplementedError(f"Update no soportado en el stand-in: {op}")
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1):
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in projection}
+
+
+class FakeCursor:
+    def __init__(self, collection, docs, projection=None):
+        self._collection = collection
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = key if isinstance(key, list) else [(key, direction or 1)]
+        for field, order in reversed(keys):
+            self._docs.sort(
+                key=lambda d: (_get_path(d, field) is _MISSING, _get_path(d, field) if _get_path(d, field) is not _MISSING else 0),
+                reverse=order == -1,
+            )
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def _results(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self._projection) for d in docs]
+
+    async def to_list(self, length=None):
+        await self._collection._tick()
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection._tick()
+        for doc in self._results():
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, name: str, ops: Counter, latency: float = 0.0):
+        self.name = name
+        self.docs: dict = {}
+        self.ops = ops
+        self.latency = latency
+        self.indexes = {}
+
+    async def _tick(self, op: str | None = None):
+        if op:
+            self.ops[f"{self.name}.{op}"] += 1
+            self.ops["total"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key {doc['_id']}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return doc["_id"]
+
+    def _find(self, query):
+        return [d for d in self.docs.values() if matches(d, query or {})]
+
+    def _upsert_doc(self, query):
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        return doc
+
+    def _update(self, query, update, upsert=False, many=False):
+        targets = self._find(query)
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            apply_update(doc, update)
+        upserted_id = None
+        if not targets and upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            upserted_id = self._insert(doc)
+        return SimpleNamespace(matched_count=len(targets), modified_count=len(targets),
+                               upserted_id=upserted_id, acknowledged=True)
+
+    async def create_index(self, keys, **kwargs):
+        await self._tick("create_index")
+        name = kwargs.get("name") or str(keys)
+        self.indexes[name] = kwargs
+        return name
+
+    async def insert_one(self, doc):
+        await self._tick("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(doc), acknowledged=True)
+
+    async def insert_many(self, docs, ordered=True):
+        await self._tick("insert_many")
+        ids, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc))
+            except DuplicateKeyError:
+                errors.append({"index": index, "code": 11000})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    async def find_one(self, query=None, projection=None, sort=None, **kwargs):
+        await self._tick("find_one")
+        cursor = FakeCursor(self, self._find(query), projection)
+        if sort:
+            cursor.sort(sort)
+        results = cursor.limit(1)._results()
+        return results[0] if results else None
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.ops[f"{self.name}.find"] += 1
+        self.ops["total"] += 1
+        return FakeCursor(self, self._find(query), projection)
+
+    async def count_documents(self, query, **kwargs):
+        await self._tick("count_documents")
+        return len(self._find(query))
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        await self._tick("update_one")
+        return self._update(query, update, upsert=upsert)
+
+    async def update_many(self, query, update, upsert=False, **kwargs):
+        await self._tick("update_many")
+        return self._update(query, update, upsert=upsert, many=True)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=False, **kwargs):
+        await self._tick("find_one_and_update")
+        before = self._find(query)[:1]
+        result = self._update(query, update, upsert=upsert)
+        target_id = result.upserted_id or (before[0]["_id"] if before else None)
+        if target_id is None:
+            return None
+        return _project(self.docs[target_id], projection)
+
+    async def delete_one(self, query):
+        await self._tick("delete_one")
+        found = self._find(query)[:1]
+        for doc in found:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def bulk_write(self, operations, ordered=True):
+        await self._tick("bulk_write")
+        upserted, modified = {}, 0
+        for index, op in enumerate(operations):
+            if isinstance(op, InsertOne):
+                self._insert(op._doc)
+            elif isinstance(op, (UpdateOne, UpdateMany)):
+                result = self._update(op._filter, op._doc, upsert=bool(op._upsert),
+                                      many=isinstance(op, UpdateMany))
+                modified += result.modified_count
+                if result.upserted_id is not None:
+                    upserted[index] = result.upserted_id
+            elif isinstance(op, DeleteOne):
+                for doc in self._find(op._filter)[:1]:
+                    del self.docs[doc["_id"]]
+        return SimpleNamespace(upserted_ids=upserted, modified_count=modified,
+                               matched_count=modified, acknowledged=True)
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.ops = Counter()
+        self.latency = latency
+        self.collections: dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self.ops, self.latency)
+        return self.collections[name]
+
+
+def install_fake_mongo(db: FakeDatabase):
+    """
+    Sustituye las colecciones motor importadas por los módulos `app.*`
+    (incluidas las guardadas en instancias como dedup_store o n8n_outbox).
+    """
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app.") or module is None:
+            continue
+        for attr, value in list(vars(module).items()):
+            if isinstance(value, AsyncIOMotorCollection):
+                setattr(module, attr, db[value.name])
+            elif isinstance(getattr(value, "collection", None), AsyncIOMotorCollection):
+                value.collection = db[value.collection.name]
+
+
+# --- Graph API / n8n ---
+class FakeHttp:
+    """Responde como Graph API y n8n, con latencia configurable."""
+
+    def __init__(self, graph_latency: float = 0.0, n8n_latency: float = 0.0, media_size: int = 256 * 1024):
+        self.graph_latency = graph_latency
+        self.n8n_latency = n8n_latency
+        self.media_size = media_size
+        self.calls = Counter()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host == "graph.facebook.com":
+            self.calls["graph"] += 1
+            await asyncio.sleep(self.graph_latency)
+            return httpx.Response(200, json={
+                "username": f"ig_{request.url.path.strip('/').split('/')[-1]}",
+                "first_name": "Cliente",
+                "last_name": request.url.path.strip("/").split("/")[-1],
+                "url": f"https://media.local/{request.url.path.strip('/').split('/')[-1]}",
+            })
+        if host == "media.local":
+            self.calls["media_download"] += 1
+            await asyncio.sleep(self.graph_latency)
+            return httpx.Response(200, content=b"\0" * self.media_size)
+        self.calls["n8n"] += 1
+        await asyncio.sleep(self.n8n_latency)
+        return httpx.Response(200, json={"ok": True})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+# --- S3 ---
+class FakeS3:
+    """Imita las llamadas de boto3 usadas por el pipeline de media."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes_uploaded = 0
+
+    def _call(self, name, **kwargs):
+        self.calls[name] += 1
+        body = kwargs.get("Body")
+        if body:
+            self.bytes_uploaded += len(body)
+        if self.latency:
+            time.sleep(self.latency)
+        return {"UploadId": "local", "ETag": f"etag-{self.calls[name]}"}
+
+    def put_object(self, **kwargs):
+        return self._call("put_object", **kwargs)
+
+    def create_multipart_upload(self, **kwargs):
+        return self._call("create_multipart_upload", **kwargs)
+
+    def upload_part(self, **kwargs):
+        return self._call("upload_part", **kwargs)
+
+    def complete_multipart_upload(self, **kwargs):
+        return self._call("complete_multipart_upload", **kwargs)
+
+    def abort_multipart_upload(self, **kwargs):
+        return self._call("abort_multipart_upload", **kwargs)
@@ -0,0 +1,208 @@
+"""
+Benchmark de carga / replay del webhook de Meta.
+
+Levanta el router real de `app.meta_webhook` sobre stand-ins locales
+(MongoDB en memoria, Graph API, S3 y n8n simulados), envía entregas
+generadas o reproducidas desde un JSONL y reporta latencia de respuesta
+(p50/p95/p99), mensajes por segundo y operaciones de Mongo.
+
+Uso (desde Backend/):
+    python -m benchmarks.webhook_bench --deliveries 2000 --concurrency 50
+    python -m benchmarks.webhook_bench --async-mode --batch-size 5
+    python -m benchmarks.webhook_bench --replay eventos.jsonl --json
+
+El corpus real sale del log de eventos del webhook:
+    python -m app.meta_webhook.replay export eventos.jsonl
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+# Configuración mínima para poder importar la app sin servicios reales
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("PAGE_ACCESS_TOKEN", "bench")
+os.environ.setdefault("WHATSAPP_TOKEN", "bench")
+os.environ.setdefault("N8N_WEBHOOK_URL_WHATSAPP", "http://n8n.local/whatsapp")
+os.environ.setdefault("N8N_WEBHOOK_URL_FACEBOOK", "http://n8n.local/facebook")
+os.environ.setdefault("N8N_WEBHOOK_URL_INSTAGRAM", "http://n8n.local/instagram")
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.payloads import count_messages, generate_deliveries, load_deliveries
+from benchmarks.standins import FakeDatabase, FakeHttp, FakeS3, install_fake_mongo
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_app() -> FastAPI:
+    from app.meta_webhook.routes import router as meta_webhook_router
+
+    app = FastAPI()
+    app.include_router(meta_webhook_router)
+    return app
+
+
+async def run(args) -> dict:
+    import app.core.http_client as http_client
+    import app.meta_webhook.media as media
+    import app.meta_webhook.queue as queue_module
+    from app.database.indexes import IndexManager
+    from app.meta_webhook.dedup import dedup_store
+    from app.meta_webhook.profiles import profile_cache
+    from app.n8n.outbox import n8n_outbox
+
+    app = build_app()
+
+    db = FakeDatabase(latency=args.mongo_latency_ms / 1000)
+    fake_http = FakeHttp(graph_latency=args.graph_latency_ms / 1000,
+                         n8n_latency=args.n8n_latency_ms / 1000)
+    fake_s3 = FakeS3(latency=args.s3_latency_ms / 1000)
+    install_fake_mongo(db)
+    http_client._client = fake_http.client()
+    media.s3 = fake_s3
+    queue_module.WEBHOOK_ASYNC_MODE = args.async_mode
+    sys.modules["app.meta_webhook.routes"].WEBHOOK_ASYNC_MODE = args.async_mode
+
+    if args.replay:
+        deliveries = load_deliveries(args.replay)
+    else:
+        deliveries = generate_deliveries(
+            args.deliveries,
+            users=args.users,
+            batch_size=args.batch_size,
+            duplicate_ratio=args.duplicate_ratio,
+            echo_ratio=args.echo_ratio,
+            media_ratio=args.media_ratio,
+            seed=args.seed,
+        )
+    total_messages = sum(count_messages(d) for d in deliveries)
+
+    await IndexManager(db).ensure()
+    if args.async_mode:
+        await queue_module.webhook_queue.start()
+    setup_ops = db.ops["total"]
+
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def send(body: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/webhook", json=body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                status = response.json().get("status", str(response.status_code))
+                statuses[status] = statuses.get(status, 0) + 1
+
+        # Los prints de la app van a /dev/null salvo con --verbose
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+            started = time.perf_counter()
+            await asyncio.gather(*(send(d) for d in deliveries))
+            acked = time.perf_counter() - started
+
+            if args.async_mode:
+                await queue_module.webhook_queue.stop()
+            ingested = time.perf_counter() - started
+            ingest_ops = db.ops["total"] - setup_ops
+
+            await media.media_pipeline.drain()
+            while await n8n_outbox.flush_once():
+                pass
+            drained = time.perf_counter() - started
+
+    mongo_ops = {k: v for k, v in sorted(db.ops.items()) if k != "total"}
+    return {
+        "mode": "async" if args.async_mode else "sync",
+        "deliveries": len(deliveries),
+        "messages": total_messages,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies, default=0), 2),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0,
+        },
+        "seconds": {
+            "ack": round(acked, 3),
+            "ingest": round(ingested, 3),
+            "with_side_effects": round(drained, 3),
+        },
+        "msgs_per_sec": {
+            "ack": round(total_messages / acked, 1) if acked else 0,
+            "ingest": round(total_messages / ingested, 1) if ingested else 0,
+        },
+        "mongo": {
+            "ingest_ops": ingest_ops,
+            "ops_per_message": round(ingest_ops / total_messages, 2) if total_messages else 0,
+            "total_ops": db.ops["total"],
+            "by_op": mongo_ops,
+            "documents": {name: len(c.docs) for name, c in db.collections.items()},
+        },
+        "http": dict(fake_http.calls),
+        "s3": {**fake_s3.calls, "bytes": fake_s3.bytes_uploaded},
+        "dedup": dedup_store.stats(),
+        "profiles": profile_cache.stats(),
+    }
+
+
+def print_report(report: dict):
+    lat = report["latency_ms"]
+    print(f"🏁 Modo {report['mode']}: {report['deliveries']} entregas, {report['messages']} mensajes")
+    print(f"   Respuestas: {report['statuses']}")
+    print(f"   Latencia (ms): p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    print(f"   Tiempo (s): ack={report['seconds']['ack']} ingesta={report['seconds']['ingest']} "
+          f"total={report['seconds']['with_side_effects']}")
+    print(f"   Mensajes/s: ack={report['msgs_per_sec']['ack']} ingesta={report['msgs_per_sec']['ingest']}")
+    mongo = report["mongo"]
+    print(f"   Mongo: {mongo['ingest_ops']} ops de ingesta ({mongo['ops_per_message']} por mensaje), "
+          f"{mongo['total_ops']} en total")
+    for op, count in mongo["by_op"].items():
+        print(f"     {op:<40} {count}")
+    print(f"   HTTP: {report['http']}  S3: {report['s3']}")
+    print(f"   Dedup: {report['dedup']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga / replay del webhook de Meta")
+    parser.add_argument("--deliveries", type=int, default=1000, help="entregas a generar")
+    parser.add_argument("--batch-size", type=int, default=1, help="mensajes por entrega")
+    parser.add_argument("--users", type=int, default=200, help="remitentes distintos por plataforma")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--echo-ratio", type=float, default=0.1)
+    parser.add_argument("--media-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--replay", help="JSONL con entregas reales (body o {payload: body})")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--async-mode", action="store_true", help="acknowledge-first con la cola")
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.5)
+    parser.add_argument("--graph-latency-ms", type=float, default=30)
+    parser.add_argument("--n8n-latency-ms", type=float, default=20)
+    parser.add_argument("--s3-latency-ms", type=float, default=10)
+    parser.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostrar los prints de la app")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -1,4 +1,15 @@
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.core.settings:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "app.core.settings:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        # Compresión permessage-deflate si el cliente la ofrece en el handshake
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true",
+        # Pings de protocolo: cierran peers TCP muertos aunque el cliente no haga heartbeat
+        ws_ping_interval=float(os.getenv("WS_PROTOCOL_PING_INTERVAL", 20)),
+        ws_ping_timeout=float(os.getenv("WS_PROTOCOL_PING_TIMEOUT", 20)),
+    )
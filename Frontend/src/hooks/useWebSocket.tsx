@@ -18,6 +18,10 @@
     timestamp: string
     direction: string
     remitente: string
+    message_id?: string
+    media_url?: string
+    // "media_ready": actualiza el mensaje `message_id` ya mostrado (no es uno nuevo)
+    event?: string
   }
 
   interface WebSocketContextType {
@@ -90,10 +90,19 @@ export function ChatWindow({ conversacion, onMarcarGestionado, token, messages }
     if (messages.length) {
       const ultimoMensaje = messages[messages.length - 1]
       if (ultimoMensaje.user_id === conversacion.user_id && ultimoMensaje.platform === conversacion.canal) {
+        if (ultimoMensaje.event === "media_ready") {
+          // La media terminó de subir: se actualiza la burbuja pendiente
+          setMensajes((prev) =>
+            prev.map((m) =>
+              m.id === ultimoMensaje.message_id ? { ...m, contenido: ultimoMensaje.media_url ?? m.contenido } : m
+            )
+          )
+          return
+        }
         setMensajes((prev) => [
           ...prev,
           {
-            id: crypto.randomUUID(),
+            id: ultimoMensaje.message_id ?? crypto.randomUUID(),
             contenido: ultimoMensaje.text,
             timestamp: ultimoMensaje.timestamp,
             esCliente: ultimoMensaje.direction === "inbound",
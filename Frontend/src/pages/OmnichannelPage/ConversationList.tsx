@@ -41,6 +41,19 @@ export function ConversationList({
 
     if (convIndex !== -1) {
       const updated = [...conversations]
+
+      if (lastMsg.event === "media_ready") {
+        // Actualiza el mensaje pendiente en vez de agregar uno nuevo
+        updated[convIndex] = {
+          ...updated[convIndex],
+          mensajes: (updated[convIndex].mensajes || []).map(m =>
+            m.id === lastMsg.message_id ? { ...m, contenido: lastMsg.media_url ?? m.contenido } : m
+          )
+        }
+        onUpdateConversations(updated)
+        return
+      }
+
       const currentName = updated[convIndex].remitente
 
       updated[convIndex] = {
@@ -55,7 +68,7 @@ export function ConversationList({
         mensajes: [
           ...(updated[convIndex].mensajes || []),
           {
-            id: crypto.randomUUID(),
+            id: lastMsg.message_id ?? crypto.randomUUID(),
             contenido: lastMsg.text,
             timestamp: lastMsg.timestamp,
             esCliente: lastMsg.direction === "inbound",
@@ -33,6 +33,23 @@ export function MessagesView({ setEnChat }: { setEnChat: (value: boolean) => voi
 
     const ultimoMensaje = messages[messages.length - 1]
 
+    if (ultimoMensaje.event === "media_ready") {
+      // Actualiza el mensaje pendiente en vez de agregar uno nuevo
+      setConversaciones((prev) =>
+        prev.map((conv) =>
+          conv.user_id === ultimoMensaje.user_id
+            ? {
+              ...conv,
+              mensajes: (conv.mensajes || []).map((m) =>
+                m.id === ultimoMensaje.message_id ? { ...m, contenido: ultimoMensaje.media_url ?? m.contenido } : m
+              )
+            }
+            : conv
+        )
+      )
+      return
+    }
+
     setConversaciones((prev) => {
       const existe = prev.find(c => c.user_id === ultimoMensaje.user_id)
 
@@ -48,7 +65,7 @@ export function MessagesView({ setEnChat }: { setEnChat: (value: boolean) => voi
               mensajes: [
                 ...(conv.mensajes || []),
                 {
-                  id: crypto.randomUUID(),
+                  id: ultimoMensaje.message_id ?? crypto.randomUUID(),
                   contenido: ultimoMensaje.text,
                   timestamp: ultimoMensaje.timestamp,
                   esCliente: ultimoMensaje.direction === "inbound",
@@ -70,7 +87,7 @@ export function MessagesView({ setEnChat }: { setEnChat: (value: boolean) => voi
           canal: ultimoMensaje.platform as 'whatsapp' | 'instagram' | 'facebook' | 'tiktok',
           gestionado: false,
           mensajes: [{
-            id: crypto.randomUUID(),
+            id: ultimoMensaje.message_id ?? crypto.randomUUID(),
             contenido: ultimoMensaje.text,
             timestamp: ultimoMensaje.timestamp,
             esCliente: ultimoMensaje.direction === "inbound",